@@ -0,0 +1,328 @@
+"""
+Rerun latency of the pages under concurrent sessions.
+
+A Streamlit server is started for the app, and each simulated user is a
+websocket session to it that speaks the same protocol as a browser tab: it asks
+for a rerun with its widget values and reads the page's messages until the
+script finishes. All sessions share one server process, the way real users
+share one `streamlit run`. Their scripts run in the server's threads, and
+st.cache_resource is shared between them.
+
+A session loads its page, then makes a series of sidebar and chart option
+changes picked at random (seeded). Every rerun is timed from the request to
+the end of the script. For each number of sessions this reports:
+
+- p50/p95/p99 rerun latency, overall and per interaction
+- reruns per second across all sessions
+- how much the server's resident memory grew
+
+The pages are loaded once before measuring, so the cached datasets are already
+in memory, like on a server that has been up for a while.
+
+Run from the root of the repo:
+
+    python benchmarks/load_test.py
+    python benchmarks/load_test.py --sessions 1 4 8 16 --reruns 20
+    python benchmarks/load_test.py --sessions 8 "pages/2-📑Full_Project_Details.py"
+"""
+import argparse
+import asyncio
+import os
+import random
+import resource
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+from pathlib import Path
+
+import numpy as np
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.Checkbox_pb2 import Checkbox
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.proto.WidgetStates_pb2 import WidgetState
+from streamlit.source_util import page_icon_and_name
+from tornado.websocket import websocket_connect
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+MAIN_PAGE = "1-👋About_this_Project.py"
+VISUALIZE = "pages/3-📊Visualize_the_Data.py"
+DETAILS = "pages/2-📑Full_Project_Details.py"
+PAGES = [VISUALIZE, DETAILS]
+REGIONS = ["Midwest", "Northeast", "South", "West"]
+FEATURES = ["Num_Incidents", "Victims_Injured", "Victims_Killed", "Total_Victims"]
+MAP_COLORS = ["Total_Victims", "Victims_Injured", "Victims_Killed", "State_Political_Color", "US_Region"]
+# the charts of the Visualize page are a few MB each
+MAX_MESSAGE_SIZE = 512 * 1024 * 1024
+
+
+class Session:
+    # one browser tab on a page: a websocket to the server, the widgets drawn
+    # on the last run and the widget values this session has set
+    def __init__(self, connection, page):
+        self.connection = connection
+        self.page_name = page_icon_and_name(Path(page))[1]
+        self.widgets = {}
+        self.states = {}
+        self.exceptions = []
+
+    @classmethod
+    async def connect(cls, url, page):
+        connection = await websocket_connect(
+            url, subprotocols=["streamlit"], max_message_size=MAX_MESSAGE_SIZE)
+        return cls(connection, page)
+
+    def find(self, kind, label):
+        # proto of the widget of that kind whose label starts with label, None
+        # if the last run didn't draw it
+        for (widget_kind, widget_label), proto in self.widgets.items():
+            if widget_kind == kind and widget_label.startswith(label):
+                return proto
+        return None
+
+    def value(self, kind, label):
+        # current value of a toggle, the one set here or its default
+        proto = self.find(kind, label)
+        state = self.states.get(proto.id)
+        return state.bool_value if state is not None else proto.default
+
+    def set(self, kind, label, value):
+        # the widget state the frontend sends for that interaction
+        proto = self.find(kind, label)
+        state = WidgetState(id=proto.id)
+        if kind == "slider":
+            state.double_array_value.data[:] = [float(v) for v in value]
+        elif kind == "multiselect":
+            state.int_array_value.data[:] = [list(proto.options).index(v) for v in value]
+        elif kind in ("selectbox", "radio"):
+            state.int_value = list(proto.options).index(value)
+        elif kind == "toggle":
+            state.bool_value = value
+        else:
+            raise ValueError(f"can't set a {kind}")
+        self.states[proto.id] = state
+
+    async def run(self):
+        # rerun the page with the widget values set so far and read its
+        # messages until the script finishes, returns the seconds it took
+        ids = {proto.id for proto in self.widgets.values()}
+        message = BackMsg()
+        message.rerun_script.page_name = self.page_name
+        message.rerun_script.widget_states.widgets.extend(
+            state for widget_id, state in self.states.items() if widget_id in ids)
+
+        start = time.perf_counter()
+        await self.connection.write_message(message.SerializeToString(), binary=True)
+        widgets = {}
+        while True:
+            payload = await self.connection.read_message()
+            if payload is None:
+                raise ConnectionError("the server closed the session")
+            msg = ForwardMsg()
+            msg.ParseFromString(payload)
+            kind = msg.WhichOneof("type")
+            if kind == "delta" and msg.delta.WhichOneof("type") == "new_element":
+                self.read_element(msg.delta.new_element, widgets)
+            elif kind == "script_finished":
+                if msg.script_finished == ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+                    continue
+                break
+        seconds = time.perf_counter() - start
+        self.widgets = widgets
+        return seconds
+
+    def read_element(self, element, widgets):
+        kind = element.WhichOneof("type")
+        if kind == "exception":
+            self.exceptions.append(element.exception.message)
+        elif kind in ("slider", "multiselect", "selectbox", "radio", "checkbox"):
+            proto = getattr(element, kind)
+            if kind == "checkbox" and proto.type == Checkbox.StyleType.TOGGLE:
+                kind = "toggle"
+            widgets[(kind, proto.label)] = proto
+
+    def close(self):
+        self.connection.close()
+
+
+def pick_years(session, rng):
+    start = rng.randint(2014, 2023)
+    session.set("slider", "Select year(s)", (start, rng.randint(start, 2023)))
+
+
+def pick_regions(session, rng):
+    session.set("multiselect", "Select US Region(s)", rng.sample(REGIONS, rng.randint(1, len(REGIONS))))
+
+
+def pick_characteristics(session, rng):
+    options = list(session.find("multiselect", "Select incident characteristic(s)").options)
+    session.set("multiselect", "Select incident characteristic(s)", rng.sample(options[:10], rng.randint(0, 2)))
+
+
+def pick_map_color(session, rng):
+    session.set("selectbox", "Pick a feature for the map", rng.choice(MAP_COLORS))
+
+
+def pick_line_feature(session, rng):
+    label = rng.choice(["Pick a feature for the 'per Year'", "Pick a feature for the 'per Month'"])
+    session.set("selectbox", label, rng.choice(FEATURES))
+
+
+def toggle_compare(session, rng):
+    session.set("toggle", "Compare two selections", not session.value("toggle", "Compare two selections"))
+
+
+def pick_compare_feature(session, rng):
+    session.set("selectbox", "Pick a feature to compare", rng.choice(FEATURES))
+
+
+def pick_original_feature(session, rng):
+    session.set("selectbox", "Choose a feature to view from the original", rng.choice(["Victims_Injured", "Victims_Killed"]))
+
+
+def pick_trimmed_feature(session, rng):
+    session.set("selectbox", "Choose a feature to view from the trimmed", rng.choice(["Victims_Injured", "Victims_Killed"]))
+
+
+# (name, widget kind, label it needs, action) per page. an action is only
+# picked when its widget is on the page, the Visualize sidebar is different in
+# comparison mode
+ACTIONS = {
+    VISUALIZE: [
+        ("years", "slider", "Select year(s)", pick_years),
+        ("regions", "multiselect", "Select US Region(s)", pick_regions),
+        ("characteristics", "multiselect", "Select incident characteristic(s)", pick_characteristics),
+        ("map color", "selectbox", "Pick a feature for the map", pick_map_color),
+        ("line feature", "selectbox", "Pick a feature for the 'per Year'", pick_line_feature),
+        ("compare", "toggle", "Compare two selections", toggle_compare),
+        ("compare feature", "selectbox", "Pick a feature to compare", pick_compare_feature),
+    ],
+    DETAILS: [
+        ("original feature", "selectbox", "Choose a feature to view from the original", pick_original_feature),
+        ("trimmed feature", "selectbox", "Choose a feature to view from the trimmed", pick_trimmed_feature),
+    ],
+}
+
+
+async def simulate(url, page, reruns, seed, results, errors):
+    # one simulated user, appends (page, interaction, seconds) to results
+    rng = random.Random(seed)
+    session = await Session.connect(url, page)
+    try:
+        results.append((page, "first run", await session.run()))
+        for _ in range(reruns):
+            available = [action for action in ACTIONS[page] if session.find(action[1], action[2]) is not None]
+            name, _, _, action = rng.choice(available)
+            action(session, rng)
+            results.append((page, name, await session.run()))
+            if session.exceptions:
+                errors.append(f"{page} after {name}: {session.exceptions[0]}")
+                return
+    except Exception as err:
+        errors.append(f"{page}: {err!r}")
+    finally:
+        session.close()
+
+
+async def load(url, pages, sessions, reruns, seed):
+    # sessions concurrent sessions spread over pages, returns the timings, the
+    # errors and the wall time
+    results, errors = [], []
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        simulate(url, pages[i % len(pages)], reruns, seed + i, results, errors)
+        for i in range(sessions)
+    ))
+    return results, errors, time.perf_counter() - start
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(port, timeout=120):
+    env = dict(os.environ, PYTHONPATH=str(ROOT_DIR))
+    server = subprocess.Popen(
+        [sys.executable, "-m", "streamlit", "run", MAIN_PAGE,
+         "--server.headless", "true", "--server.port", str(port), "--server.address", "127.0.0.1",
+         "--server.fileWatcherType", "none", "--browser.gatherUsageStats", "false"],
+        cwd=ROOT_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/_stcore/health", timeout=1):
+                return server
+        except OSError:
+            if server.poll() is not None:
+                raise RuntimeError(f"the server exited with status {server.returncode}")
+            time.sleep(0.2)
+    server.kill()
+    raise RuntimeError(f"the server didn't start within {timeout}s")
+
+
+def rss(pid):
+    # resident memory of the process in bytes
+    with open(f"/proc/{pid}/statm") as f:
+        return int(f.read().split()[1]) * resource.getpagesize()
+
+
+def percentiles(seconds):
+    return np.percentile(seconds, [50, 95, 99]) * 1000
+
+
+def report(sessions, results, errors, wall, before, after):
+    reruns = [seconds for _, name, seconds in results if name != "first run"]
+    print(f"{sessions} session(s): {len(results)} runs in {wall:.1f}s, {len(results) / wall:.2f} runs/s, "
+          f"server memory {before / 1e6:.0f} -> {after / 1e6:.0f} MB ({(after - before) / 1e6:+.0f} MB)")
+    print(f"  {'':<34}{'runs':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    rows = [("all reruns", reruns)]
+    for page in dict.fromkeys(page for page, _, _ in results):
+        for name in dict.fromkeys(name for p, name, _ in results if p == page):
+            rows.append((f"{page_icon_and_name(Path(page))[1]}: {name}",
+                         [seconds for p, n, seconds in results if p == page and n == name]))
+    for label, seconds in rows:
+        if seconds:
+            p50, p95, p99 = percentiles(seconds)
+            print(f"  {label[:33]:<34}{len(seconds):>6}{p50:>10.0f}{p95:>10.0f}{p99:>10.0f}")
+    for error in errors:
+        print(f"  error: {error}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rerun latency of the pages under concurrent sessions.")
+    parser.add_argument("pages", nargs="*", default=PAGES, help="pages the sessions are spread over")
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 4, 8],
+                        help="numbers of concurrent sessions to measure")
+    parser.add_argument("--reruns", type=int, default=10, help="reruns per session after its first run")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    unknown = [page for page in args.pages if page not in ACTIONS]
+    if unknown:
+        parser.error(f"no scripted interactions for {unknown}, expected some of {list(ACTIONS)}")
+
+    port = free_port()
+    server = start_server(port)
+    url = f"ws://127.0.0.1:{port}/_stcore/stream"
+    try:
+        # load the cached datasets once, like a server that has been up for a while
+        _, errors, wall = asyncio.run(load(url, args.pages, len(args.pages), 0, args.seed))
+        print(f"warm up: {wall:.1f}s")
+        for error in errors:
+            print(f"  error: {error}")
+
+        for sessions in args.sessions:
+            before = rss(server.pid)
+            results = asyncio.run(load(url, args.pages, sessions, args.reruns, args.seed))
+            report(sessions, *results, before, rss(server.pid))
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    main()
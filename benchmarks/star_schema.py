@@ -0,0 +1,58 @@
+"""
+Memory footprint and group-by time of the merged dataset against its star
+schema (trends/star.py).
+
+The incidents can be repeated --scale times to see how both layouts behave on
+a dataset the size of a multi-million row export.
+
+Run from the root of the repo:
+
+    python benchmarks/star_schema.py
+    python benchmarks/star_schema.py --scale 500
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from trends import paths, star  # noqa: E402
+
+
+def timed(func, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scale", type=int, default=1, help="times to repeat the incidents")
+    args = parser.parse_args()
+
+    merged = pd.read_csv(paths.MERGED_INCIDENTS)
+    merged = pd.concat([merged] * args.scale, ignore_index=True)
+    schema = star.build(merged)
+
+    before = merged.memory_usage(deep=True).sum()
+    after = schema.memory_usage()
+    print(f"rows            {len(merged):>12,}")
+    print(f"merged memory   {before / 1e6:>10.1f} MB")
+    print(f"star memory     {after / 1e6:>10.1f} MB  ({before / after:.1f}x smaller)")
+
+    victims = ["Total_Victims", "Victims_Injured", "Victims_Killed"]
+    labels = timed(lambda: merged.groupby(["State_Name", "Year"])[victims].sum())
+    codes = timed(lambda: star.resolve(
+        schema, schema.fact.groupby(["state_id", "Year"])[victims].sum().reset_index(), ["State_Name"]))
+    print(f"group-by labels {labels * 1000:>10.1f} ms")
+    print(f"group-by codes  {codes * 1000:>10.1f} ms  (labels resolved after)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Cold start of each Streamlit page.
+
+Every page is run once in a fresh Python process with Streamlit's headless
+AppTest, under `-X importtime`. For each page this reports:
+
+- first paint: time until the page's first st.markdown call, i.e. when the
+  title and intro text can be sent to the browser
+- full run: time until the script finished
+- imports: total import time while the page ran, and the slowest top-level
+  imports (cumulative, like the `-X importtime` report)
+
+Run from the root of the repo:
+
+    python benchmarks/startup.py
+    python benchmarks/startup.py --top 15 "pages/3-📊Visualize_the_Data.py"
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+PAGES = [
+    "1-👋About_this_Project.py",
+    "pages/2-📑Full_Project_Details.py",
+    "pages/3-📊Visualize_the_Data.py",
+]
+MARKER = "--- page run starts ---"
+
+
+def child(page):
+    # runs inside the fresh interpreter started by measure()
+    import streamlit as st
+    from streamlit.testing.v1 import AppTest
+
+    first_paint = []
+    markdown = st.markdown
+
+    def timed_markdown(*args, **kwargs):
+        result = markdown(*args, **kwargs)
+        if not first_paint:
+            first_paint.append(time.perf_counter())
+        return result
+
+    st.markdown = timed_markdown
+    app = AppTest.from_file(str(ROOT_DIR / page), default_timeout=600)
+
+    print(MARKER, file=sys.stderr, flush=True)
+    start = time.perf_counter()
+    app.run()
+    end = time.perf_counter()
+
+    print(json.dumps({
+        "first_paint": (first_paint[0] - start) if first_paint else None,
+        "full_run": end - start,
+        "exceptions": [str(e.value) for e in app.exception],
+    }))
+
+
+def parse_importtime(stderr):
+    # (cumulative microseconds, module) of the top-level imports done after
+    # MARKER, slowest first, plus their total
+    top_level = []
+    for line in stderr.split(MARKER, 1)[-1].splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative_us, name = line[len("import time:"):].split("|")
+        # nested imports are indented by two more spaces per level
+        if name.startswith("  "):
+            continue
+        top_level.append((int(cumulative_us), name.strip()))
+    top_level.sort(reverse=True)
+    return sum(us for us, _ in top_level), top_level
+
+
+def measure(page):
+    env = dict(os.environ, PYTHONPATH=str(ROOT_DIR))
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", __file__, "--child", page],
+        cwd=ROOT_DIR, env=env, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"{page} failed:\n{proc.stderr[-2000:]}")
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    result["import_total"], result["imports"] = parse_importtime(proc.stderr)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold start of each Streamlit page.")
+    parser.add_argument("pages", nargs="*", default=PAGES)
+    parser.add_argument("--top", type=int, default=8, help="number of imports to list per page")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child)
+        return
+
+    for page in args.pages:
+        result = measure(page)
+        first_paint = result["first_paint"]
+        print(page)
+        print(f"  first paint  {first_paint:8.3f}s" if first_paint is not None else "  first paint       n/a")
+        print(f"  full run     {result['full_run']:8.3f}s")
+        print(f"  imports      {result['import_total'] / 1e6:8.3f}s")
+        for us, name in result["imports"][:args.top]:
+            print(f"    {us / 1e6:8.3f}s  {name}")
+        if result["exceptions"]:
+            print(f"  exceptions   {result['exceptions']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,32 +1,20 @@
 import streamlit as st
 import numpy as np
-import pandas as pd
-import plotly.express as px
-import plotly.figure_factory as ff
-import io
+
+# plotly is only imported once the first chart is drawn
+from trends.charts import px
+
+from trends import paths, profile, store, validation
 
 st.set_page_config(page_title="Full Project Details")
 st.title("Full Project Details")
 
 # helper functions for displaying things
-def get_df_info(df):
-    buffer = io.StringIO ()
-    df.info (buf=buffer)
-    lines = buffer.getvalue ().split ('\n')
-
-    # lines to print directly
-    # lines_to_print = [0, 1, 2, -2, -3]
-    #for i in lines_to_print:
-    st.write (lines [2])
-
-    # lines to arrange in a df
-    list_of_list = []
-    for x in lines [5:-3]:
-        list = x.split ()
-        list_of_list.append (list)
-    info_df = pd.DataFrame (list_of_list, columns=['index', 'Column', 'Non-null-Count', 'null', 'Dtype'])
-    info_df.drop (columns=['index', 'null'], axis=1, inplace=True)
-    st.table(info_df)
+def get_df_info(data_profile):
+    # what df.info() shows, taken from the precomputed profile
+    info = profile.columns(data_profile)[["Column", "Non-Null Count", "Dtype"]]
+    st.write(f"Data columns (total {len(info)} columns):")
+    st.table(info.rename(columns={"Non-Null Count": "Non-null-Count"}))
 
 # Removing the outliers, trim 10%
 def remove_outliers(data, col):
@@ -41,17 +29,26 @@ def remove_outliers(data, col):
     filtered_data = data.loc[data[col].isin(outlier_free_list)]
     return filtered_data
 
-# session state
-@st.cache_data
+# session state, the datasets are read-only copies shared by every session
+# and server process, see trends/store.py
+@st.cache_resource
 def load_data():
-    return pd.read_csv("data/mass-shootings-2014-2023.csv")
+    return store.attach(paths.RAW_INCIDENTS)
 data = load_data()
 
-@st.cache_data
+@st.cache_resource
 def load_cleaned():
-    return pd.read_csv("data/cleaned_mass_shootings_2014-2023.csv")
+    return store.attach(paths.CLEANED_INCIDENTS)
 cleaned = load_cleaned()
 
+# dtypes, null counts, summary statistics and value counts of each dataset,
+# computed once per version of the file, see trends/profile.py
+@st.cache_resource
+def load_profile(path):
+    return profile.load(path)
+data_profile = load_profile(paths.RAW_INCIDENTS)
+cleaned_profile = load_profile(paths.CLEANED_INCIDENTS)
+
 @st.cache_data
 def load_trimmed_cleaned():
     victim_cols = ['Victims_Injured', 'Victims_Killed', 'Total_Victims']
@@ -105,7 +102,7 @@ st.markdown(
     
     """)
 st.dataframe(data.head())
-get_df_info(data)
+get_df_info(data_profile)
 
 st.markdown(
     """
@@ -131,7 +128,7 @@ st.markdown(
     whether we can actually use those columns.
     
     """)
-st.table(pd.DataFrame(data.isna().sum(), columns=['Num of NAs']))
+st.table(profile.null_counts(data_profile).to_frame('Num of NAs'))
 
 st.markdown(
     """
@@ -175,7 +172,7 @@ st.markdown(
     """
 )
 
-st.dataframe(data[(data['Victims_Injured'] + data['Victims_Killed']) < 4])
+st.dataframe(data[validation.violations("mass_shooting_definition", data)])
 
 st.markdown(
     """
@@ -245,25 +242,25 @@ st.markdown(
     """
 )
 
-st.table(cleaned[['Victims_Injured', 'Victims_Killed', 'Total_Victims']].describe())
+st.table(profile.describe(cleaned_profile, ['Victims_Injured', 'Victims_Killed', 'Total_Victims']))
 
 col1,col2,col3,col4 = st.columns(4)
 
 with col1:
     # chart for year
-    st.table(cleaned["Year"].value_counts())
+    st.table(profile.value_counts(cleaned_profile, "Year"))
 
 with col2:
     # chart for month
-    st.table(cleaned["Month"].value_counts())
+    st.table(profile.value_counts(cleaned_profile, "Month"))
 
 with col3:
     # chart for month
-    st.table(cleaned["State_Name"].value_counts().head(10))
+    st.table(profile.value_counts(cleaned_profile, "State_Name", 10))
 
 with col4:
     # chart for month
-    st.table(cleaned["City_or_County"].value_counts().head(10))
+    st.table(profile.value_counts(cleaned_profile, "City_or_County", 10))
 
 st.markdown(
     """
@@ -1,12 +1,11 @@
 import streamlit as st
 import numpy as np
 import pandas as pd
-from scipy.stats import rankdata
 
-# for graphing
-import plotly.express as px
-import plotly.graph_objects as go
-import plotly.figure_factory as ff
+# for graphing, plotly is only imported once the first chart is drawn
+from trends.charts import ff, go, px, quantile_rank
+
+from trends import characteristics, choropleth, compare, export, forecast, paths, selection, star, store
 
 st.set_page_config(page_title="Visualize the Data")
 st.title("Visualize the Data")
@@ -18,11 +17,25 @@ st.markdown("""
     The filters in the sidebar allow you to configure the incident dataset by Year, 
     US Region, and State. Selecting the US Region will reset the selection of the State, 
     so be sure to select which US Regions you'd like to include first before configuring 
-    the selected states. 
+    the selected states. The incident characteristic filter keeps incidents tagged with 
+    all (or any) of the picked characteristics, such as drive-by or school incidents.
+
+    Selecting incidents on the map with the box or lasso tool, or clicking bars in the 
+    City/County and State charts, filters every other chart to that selection. Use the 
+    "Clear chart selections" button in the sidebar to go back to the sidebar filters only.
+
+    Switch the map to "State incident rates" to color each state by its average yearly 
+    incidents or victims per 100K residents, or its political color, over the filtered years.
+
+    When the selected years reach 2023, the "By Year" and "By Month" charts can extend into a 
+    forecast with its 95% interval, which repeats the last year's level with the usual monthly pattern.
             
     The data shown in the charts are made of of three datasets (mass shooting 
     incident data from the Gun Violence Archive and the estimated population from 
     2014-2023 for each city and state from the US Census Bureau). 
+
+    The incidents selected by the filters, and the data behind each chart, can be 
+    downloaded as CSV, Parquet or GeoJSON from the export section at the bottom of the page.
 """)
 
 # Removing the outliers, trim 10%
@@ -38,14 +51,165 @@ def remove_outliers(data, col):
     filtered_data = data.loc[data[col].isin(outlier_free_list)]
     return filtered_data
 
-@st.cache_data(show_spinner=False)
+# the merged incidents as a star schema: integer keyed fact rows plus the
+# label tables, memory mapped and shared by every session and server process.
+# see trends/star.py and trends/store.py
+@st.cache_resource(show_spinner=False)
 def load_data():
-    # import the state popoulation and rename the columns
-    cleaned = pd.read_csv("data/merged_mass_shootings_2014-2023.csv")
-    return cleaned
+    return star.attach(paths.MERGED_INCIDENTS)
+
+@st.cache_resource(show_spinner=False)
+def data_version():
+    return store.version(paths.MERGED_INCIDENTS)
+
+@st.cache_resource(show_spinner=False)
+def raw_version():
+    return store.version(paths.RAW_INCIDENTS)
 
 with st.spinner("Loading data... Estimated to take around 1 minute.", show_time=True):
-    cleaned = load_data()
+    incidents = load_data()
+    fact = incidents.fact
+
+# region and political color of each state, indexed by state_id
+@st.cache_resource(show_spinner=False)
+def load_states(version):
+    return star.states(load_data())
+
+# key column, label code of each key and the labels for the city and state
+# charts, so they group on integers and only look up the bars they draw
+@st.cache_resource(show_spinner=False)
+def load_label_codes(version):
+    return {column: star.label_codes(load_data(), column) for column in star.LABEL_KEYS}
+
+def label_codes(rows, column):
+    key, by_key, labels = load_label_codes(data_version())[column]
+    return by_key[rows[key].to_numpy()], labels
+
+states = load_states(data_version())
+
+# per (state, year, month) totals that both sides of a comparison are read from,
+# aggregated on the integer keys of the star schema (see trends/star.py)
+@st.cache_resource(show_spinner=False)
+def load_cube(version):
+    return compare.build_cube(load_data())
+
+@st.cache_resource(show_spinner=False)
+def load_state_population():
+    return compare.load_state_population()
+
+# incident and victim totals per (state, year) for the state map, see trends/choropleth.py
+@st.cache_resource(show_spinner=False)
+def load_state_totals(version):
+    return choropleth.state_year(load_cube(version))
+
+# seasonal models of the monthly counts of every state and region, see trends/forecast.py
+@st.cache_resource(show_spinner=False)
+def load_forecast(version):
+    return forecast.load(paths.MERGED_INCIDENTS)
+
+# tag -> Incident_IDs of the raw Incident_Characteristics, see trends/characteristics.py
+@st.cache_resource(show_spinner=False)
+def load_characteristics(version):
+    return characteristics.load(paths.RAW_INCIDENTS)
+
+with st.sidebar:
+    compare_mode = st.toggle("Compare two selections")
+
+if compare_mode:
+    def comparison_filters(name, default_colors):
+        st.subheader("Selection " + name)
+        selected_year = st.slider(
+            "Select year(s)",
+            2014,
+            2023,
+            (2014,2023),
+            key="compare_year_" + name
+        )
+        selected_regions = st.multiselect(
+            "Select US Region(s)",
+            states["US_Region"].unique().tolist(),
+            states["US_Region"].unique().tolist(),
+            key="compare_region_" + name
+        )
+        selected_colors = st.multiselect(
+            "Select political color(s)",
+            ["RED", "BLUE", "PURPLE"],
+            default_colors,
+            key="compare_color_" + name
+        )
+        in_selection = states["US_Region"].isin(selected_regions) & states["State_Political_Color"].isin(selected_colors)
+        selected_states = st.multiselect(
+            "Select state(s)",
+            states["State_Name"].tolist(),
+            states.loc[in_selection, "State_Name"].tolist(),
+            key="compare_state_" + name
+        )
+        return dict(year=selected_year, us_region=selected_regions, state=selected_states, colors=selected_colors)
+
+    with st.sidebar:
+        filter_sets = {
+            "Selection A": comparison_filters("A", ["RED"]),
+            "Selection B": comparison_filters("B", ["BLUE"]),
+        }
+
+    cube = load_cube(data_version())
+    population = load_state_population()
+    masks = {name: compare.cube_mask(cube, **filters) for name, filters in filter_sets.items()}
+    pop_masks = {name: compare.population_mask(population, states, **filters) for name, filters in filter_sets.items()}
+
+    st.header("Compare Two Selections")
+
+    # metrics for each selection, B shows its difference to A
+    metric_labels = {
+        "Num_Incidents": "Number of Incidents",
+        "Total_Victims": "Total Victims",
+        "Max_Victims_Injured": "Highest # of Injured",
+        "Max_Victims_Killed": "Highest # of Killed",
+    }
+    selection_metrics = {name: compare.metrics(cube, mask) for name, mask in masks.items()}
+    for name, values in selection_metrics.items():
+        st.subheader(name)
+        metric_cols = st.columns(len(metric_labels))
+        for metric_col, (key, label) in zip(metric_cols, metric_labels.items()):
+            delta = None
+            if name == "Selection B":
+                delta = values[key] - selection_metrics["Selection A"][key]
+            metric_col.metric(label, values[key], delta=delta, delta_color="inverse")
+
+    compare_feature = st.selectbox(
+        "Pick a feature to compare",
+        compare.FEATURES
+    )
+    compare_col1, compare_col2 = st.columns(2)
+    with compare_col1:
+        st.plotly_chart(px.line(compare.by_year(cube, masks, compare_feature),
+                                x="Year",
+                                y=compare_feature,
+                                color="Selection",
+                                title=compare_feature + " per Year"))
+    with compare_col2:
+        st.plotly_chart(px.line(compare.by_month(cube, masks, compare_feature,
+                                                 {name: filters["year"] for name, filters in filter_sets.items()}),
+                                x="Month",
+                                y=compare_feature,
+                                color="Selection",
+                                title="Average " + compare_feature + " by Month"))
+
+    # incident rates by group, and how much B differs from A
+    rate_choice = st.selectbox(
+        "Compare incident rates per 100K residents by",
+        ("US_Region", "State_Political_Color", "State_Name")
+    )
+    rates = compare.incident_rates(cube, population, pop_masks, masks, by=rate_choice, states=states)
+    rates_long = rates.melt(id_vars=rate_choice, value_vars=list(masks), var_name="Selection", value_name="IncidentRate")
+    st.plotly_chart(px.bar(rates_long,
+                           x=rate_choice,
+                           y="IncidentRate",
+                           color="Selection",
+                           barmode="group",
+                           title="Average Yearly Incident Rate per 100K Residents"))
+    st.dataframe(rates, hide_index=True)
+    st.stop()
 
 with st.sidebar:
     st.subheader("Filter the Data")
@@ -58,29 +222,89 @@ with st.sidebar:
 
     us_region = st.multiselect(
         "Select US Region(s)",
-        cleaned["US_Region"].unique().tolist(),
-        cleaned["US_Region"].unique().tolist()
+        states["US_Region"].unique().tolist(),
+        states["US_Region"].unique().tolist()
     )
 
     state = st.multiselect(
         "Select state(s)",
-        cleaned["State_Name"].unique().tolist(),
-        cleaned.loc[cleaned["US_Region"].isin(us_region), 'State_Name'].unique().tolist()
+        states["State_Name"].tolist(),
+        states.loc[states["US_Region"].isin(us_region), 'State_Name'].tolist()
     )
 
-filtered_us_region = cleaned[cleaned["US_Region"].isin(us_region)]
-filtered_state = cleaned[cleaned["State_Name"].isin(state)]
-filtered_year = cleaned[(cleaned["Year"] >= year[0]) & (cleaned["Year"] <= year[1])]
+    characteristic_index = load_characteristics(raw_version())
+    tags = st.multiselect(
+        "Select incident characteristic(s)",
+        characteristic_index.counts().sort_values(ascending=False).index.tolist(),
+        help="Only keep incidents tagged with these characteristics by the Gun Violence Archive"
+    )
+    tag_match = st.radio(
+        "Match",
+        ("all", "any"),
+        format_func=lambda match: match.capitalize() + " selected characteristics",
+        horizontal=True,
+        disabled=len(tags) < 2
+    )
 
-filtered = filtered_us_region.merge(filtered_state, on='Incident_ID', how='inner').merge(filtered_year, on='Incident_ID', how='inner')
+# selecting points on the map or clicking bars filters every other chart.
+# the charts get new keys when the selections are cleared, since their
+# selection state can't be reset through session state
+if "selection_generation" not in st.session_state:
+    st.session_state["selection_generation"] = 0
+
+def chart_key(name):
+    return name + "_" + str(st.session_state["selection_generation"])
+
+CITY_CHARTS = ("city_total_bar", "city_num_bar", "city_rate_bar")
+STATE_CHARTS = ("state_total_bar", "state_num_bar", "state_rate_bar")
+
+def bar_selection(column, charts):
+    values = set()
+    for chart in charts:
+        values |= selection.selected_values(st.session_state.get(chart_key(chart))) or set()
+    if not values:
+        return None
+    # the clicked labels are turned into the keys carrying them
+    key, by_key, labels = load_label_codes(data_version())[column]
+    keys = np.flatnonzero(np.isin(labels[by_key], list(values)))
+    return selection.rows_with_values(fact, key, keys)
+
+# everything is kept as row positions into the fact table, see trends/selection.py
+state_ids = states.index[states["US_Region"].isin(us_region) & states["State_Name"].isin(state)]
+sidebar_rows = selection.intersect(
+    selection.filter_rows(fact, year, state_ids),
+    selection.rows_with_ids(fact, characteristics.query(characteristic_index, tags, tag_match))
+)
+map_rows = selection.selected_rows(st.session_state.get(chart_key("map")))
+city_rows = bar_selection("City_or_County", CITY_CHARTS)
+state_rows = bar_selection("State_Name", STATE_CHARTS)
+
+if any(rows is not None for rows in (map_rows, city_rows, state_rows)):
+    with st.sidebar:
+        if st.button("Clear chart selections"):
+            st.session_state["selection_generation"] += 1
+            st.rerun()
+
+# a chart isn't filtered by its own selection so it can still be changed
+filtered = fact.iloc[selection.intersect(sidebar_rows, map_rows, city_rows, state_rows)]
+map_filtered = fact.iloc[selection.intersect(sidebar_rows, city_rows, state_rows)]
+city_filtered = fact.iloc[selection.intersect(sidebar_rows, map_rows, state_rows)]
+state_filtered = fact.iloc[selection.intersect(sidebar_rows, map_rows, city_rows)]
 
 # statistics on shown incidents
 if filtered.empty:
     st.write("No data available for the selected filters.")
 else:
     def create_scattermap(filtered, color):
+        # the row position of each incident comes back with the selected points.
+        # only the labels the map shows are looked up for its rows
+        labels = ["City_or_County", "Incident_Date"]
+        if color in ("State_Political_Color", "US_Region"):
+            labels.append(color)
+        filtered = star.resolve(incidents, filtered, labels)
+        filtered = filtered.assign(**{selection.ROW_COLUMN: filtered.index})
         if color in ("Total_Victims", "Victims_Injured", "Victims_Killed"):
-            filtered['quantile_rank'] = rankdata(filtered[color], method='average') / len(filtered[color])
+            filtered = filtered.assign(quantile_rank=quantile_rank(filtered[color]))
             color_scale = [
                 '#FFC0CB',  # Pink
                 '#FFB6C1',  # Light Pink
@@ -107,6 +331,7 @@ else:
                                         "Victims_Injured": True, 
                                         "Victims_Killed": True
                                     },
+                                    custom_data=[selection.ROW_COLUMN],
                                     color="quantile_rank",
                                     color_continuous_scale=color_scale, 
                                     zoom=3, 
@@ -158,6 +383,7 @@ else:
                                         "Victims_Injured": True, 
                                         "Victims_Killed": True
                                     },
+                                    custom_data=[selection.ROW_COLUMN],
                                     color=picked_variable,  # Use the 'Region' column for coloring
                                     color_discrete_map=color_map,  # Apply the color map
                                     zoom=3, 
@@ -181,13 +407,77 @@ else:
 
         return fig
 
+    def create_choropleth(rates, metric):
+        # one shape per state, colored by its rate or political color
+        hover_data = {
+            "State_Code": False,
+            "Num_Incidents": True,
+            "Total_Victims": True,
+            "Avg_Population": ":,.0f",
+            "Incident_Rate": ":.3f",
+            "Victim_Rate": ":.3f",
+        }
+        if metric == "State_Political_Color":
+            fig = px.choropleth(rates,
+                                locations="State_Code",
+                                locationmode="USA-states",
+                                scope="usa",
+                                hover_name="State_Name",
+                                hover_data=hover_data,
+                                color=metric,
+                                color_discrete_map={
+                                    'RED': '#FF0000',
+                                    'BLUE': '#0000FF',
+                                    'PURPLE': '#800080'
+                                },
+                                height=600)
+            fig.update_layout(
+                legend=dict(
+                    x=0.5,
+                    y=0.95,
+                    bgcolor='rgba(255, 255, 255, 0.75)',
+                    orientation="h",
+                    xanchor='center',
+                    yanchor='top',
+                )
+            )
+        else:
+            fig = px.choropleth(rates,
+                                locations="State_Code",
+                                locationmode="USA-states",
+                                scope="usa",
+                                hover_name="State_Name",
+                                hover_data=hover_data,
+                                color=metric,
+                                color_continuous_scale="Reds",
+                                height=600)
+            fig.update_layout(
+                coloraxis_colorbar=dict(
+                    title=choropleth.METRICS[metric],
+                    orientation='h',
+                    x=0.5,
+                    y=0.95,
+                    xanchor='center',
+                    yanchor='top',
+                    thickness=10,
+                    len=0.5,
+                    bgcolor='rgba(255, 255, 255, 0.75)'
+                )
+            )
+        return fig
+
     def create_bar(filtered, choice):
-        bar_filtered = filtered[[choice, "Total_Victims", "Victims_Injured", "Victims_Killed"]]
+        # grouped on the integer code of each label, only the top 10 get their
+        # labels back. the int16 victim counts are widened so the totals sort
+        # (ties included) the same as before
+        codes, labels = label_codes(filtered, choice)
+        bar_filtered = filtered[["Total_Victims", "Victims_Injured", "Victims_Killed"]].astype("int64").assign(**{choice: codes})
 
         # organize the city data
         total_filtered = pd.DataFrame(bar_filtered.groupby(choice)[["Total_Victims", "Victims_Injured", "Victims_Killed"]].sum().sort_index())
         total_filtered.reset_index(inplace=True)
         total_filtered = total_filtered.sort_values(by="Total_Victims", ascending=False).head(10)
+        total_filtered[choice] = labels[total_filtered[choice]]
         total_title = "Top 10 " + choice + " by Total Victims"
         total_fig = px.bar(total_filtered, 
                                 x=choice, 
@@ -214,6 +504,7 @@ else:
         num_filtered = pd.DataFrame(bar_filtered[choice].value_counts())
         num_filtered.reset_index(inplace=True)
         num_filtered = num_filtered.sort_values(by="count", ascending=False).head(10)
+        num_filtered[choice] = labels[num_filtered[choice]]
         num_title = "Top 10 " + choice + " by Number of Incidents"
         num_fig = px.bar(num_filtered, 
                                 x=choice, 
@@ -237,17 +528,21 @@ else:
             )
         )
 
-        return total_fig, num_fig
+        return total_fig, num_fig, total_filtered, num_filtered
 
     def create_dist(filtered, choice):
-        dist_filtered = filtered[[choice, "Total_Victims", "Victims_Injured", "Victims_Killed"]]
+        # the distributions only need the groups, not their labels
+        codes, _ = label_codes(filtered, choice)
+        dist_filtered = filtered[["Total_Victims", "Victims_Injured", "Victims_Killed"]].astype("int64").assign(**{choice: codes})
 
         # organize the city data
         total_filtered = pd.DataFrame(dist_filtered.groupby(choice)["Total_Victims"].sum().sort_index())
         total_filtered.reset_index(inplace=True)
         total_filtered = total_filtered.sort_values(by="Total_Victims", ascending=False)
         # total_title = "Distribution of all " + choice + " by Total Victims"
-        total_fig = ff.create_distplot([total_filtered['Total_Victims']], group_labels=['Total_Victims'], bin_size=50)
+        # the KDE curve needs values that vary, which small selections may not have
+        total_fig = ff.create_distplot([total_filtered['Total_Victims']], group_labels=['Total_Victims'], bin_size=50,
+                                       show_curve=total_filtered['Total_Victims'].nunique() > 1)
         total_fig.update_layout(
             legend=dict(
                 x=0.5, 
@@ -262,7 +557,8 @@ else:
         num_filtered.reset_index(inplace=True)
         num_filtered = num_filtered.sort_values(by="count", ascending=False)
         # num_title = "Distribution of all " + choice + " by Number of Incidents"
-        num_fig = ff.create_distplot([num_filtered['count']], group_labels=['count'], bin_size=10)
+        num_fig = ff.create_distplot([num_filtered['count']], group_labels=['count'], bin_size=10,
+                                     show_curve=num_filtered['count'].nunique() > 1)
         num_fig.update_layout(
             legend=dict(
                 x=0.5, 
@@ -276,7 +572,7 @@ else:
         return total_fig, num_fig
 
     def create_incidentchart(filtered, choice):
-        incident_filtered = filtered[["State_Name", "City_or_County", "Incident_ID", "State_Political_Color", "Year", "State_PopEstimate", "City_PopEstimate"]]
+        incident_filtered = filtered[["state_id", "place_id", "Incident_ID", "Year"]]
 
         color_map  = {
             'RED': '#FF0000', 
@@ -285,12 +581,19 @@ else:
         }
 
         if choice == "State_Name":
-            bar_incident = pd.DataFrame(incident_filtered.groupby(["State_Name", "State_Political_Color", "Year", "State_PopEstimate"])["Incident_ID"].count())
+            # incidents per (state, year) over that year's population, on the
+            # integer keys. states and years without a population estimate are left out
+            bar_incident = pd.DataFrame(incident_filtered.groupby(["state_id", "Year"])["Incident_ID"].count())
             bar_incident.reset_index(inplace=True)
+            bar_incident["State_PopEstimate"] = star.population(incidents.state_population, "state_id", "State_PopEstimate",
+                                                                bar_incident["state_id"], bar_incident["Year"])
+            bar_incident = bar_incident.dropna(subset=["State_PopEstimate"])
             bar_incident["State_IncidentRate"] = (bar_incident["Incident_ID"]/bar_incident["State_PopEstimate"])*100000
-            incident_rate = pd.DataFrame(bar_incident.groupby(["State_Name", "State_Political_Color"])["State_IncidentRate"].mean())
+            incident_rate = pd.DataFrame(bar_incident.groupby(["state_id"])["State_IncidentRate"].mean())
             incident_rate.reset_index(inplace=True)
             incident_rate = incident_rate.sort_values(by="State_IncidentRate", ascending=False).head(20)
+            incident_rate = star.resolve(incidents, incident_rate, ["State_Name", "State_Political_Color"])
+            incident_rate = incident_rate[["State_Name", "State_Political_Color", "State_IncidentRate"]]
 
             incident_fig = px.bar(incident_rate, 
                                 x=choice, 
@@ -310,12 +613,18 @@ else:
             incident_fig.update_xaxes(categoryorder="total descending")
 
         elif choice == "City_or_County":
-            bar_incident = pd.DataFrame(incident_filtered.groupby(["State_Name", "City_or_County", "State_Political_Color", "Year", "City_PopEstimate"]).value_counts())
-            bar_incident.reset_index(inplace=True)
+            # every incident over its city's population that year, averaged per
+            # place. places and years without a population estimate are left out
+            bar_incident = incident_filtered.assign(count=1)
+            bar_incident["City_PopEstimate"] = star.population(incidents.place_population, "place_id", "City_PopEstimate",
+                                                               bar_incident["place_id"], bar_incident["Year"])
+            bar_incident = bar_incident.dropna(subset=["City_PopEstimate"])
             bar_incident["City_IncidentRate"] = (bar_incident["count"]/bar_incident["City_PopEstimate"])*1000
-            incident_rate = pd.DataFrame(bar_incident.groupby(["State_Name", "City_or_County", "State_Political_Color"])["City_IncidentRate"].mean())
+            incident_rate = pd.DataFrame(bar_incident.groupby(["state_id", "place_id"])["City_IncidentRate"].mean())
             incident_rate.reset_index(inplace=True)
             incident_rate = incident_rate.sort_values(by="City_IncidentRate", ascending=False).head(20)
+            incident_rate = star.resolve(incidents, incident_rate, ["State_Name", "City_or_County", "State_Political_Color"])
+            incident_rate = incident_rate[["State_Name", "City_or_County", "State_Political_Color", "City_IncidentRate"]]
 
             incident_fig = px.bar(incident_rate, 
                                 x=choice, 
@@ -396,76 +705,144 @@ else:
             year_dist = pd.DataFrame(filtered.groupby(["Year"])["Incident_ID"].count())
             year_dist.reset_index(inplace=True)
 
-            fig_hist = ff.create_distplot([year_dist['Incident_ID']], group_labels=["Incident_ID"], bin_size=100)
+            fig_hist = ff.create_distplot([year_dist['Incident_ID']], group_labels=["Incident_ID"], bin_size=100,
+                                          show_curve=year_dist['Incident_ID'].nunique() > 1)
             
         elif feature in ["Victims_Injured", "Victims_Killed", "Total_Victims"]:
             year_dist = pd.DataFrame(filtered.groupby(["Year"])[feature].sum())
             year_dist.reset_index(inplace=True)
 
-            fig_hist = ff.create_distplot([year_dist[feature]], group_labels=[feature], bin_size=100)
+            fig_hist = ff.create_distplot([year_dist[feature]], group_labels=[feature], bin_size=100,
+                                          show_curve=year_dist[feature].nunique() > 1)
 
         return fig_hist, year_dist
 
+    def add_forecast(fig, x, predicted, name):
+        # dashed forecast line with its 95% interval as a shaded band
+        fig.add_trace(go.Scatter(
+            x=pd.concat([x, x[::-1]]),
+            y=pd.concat([predicted["Upper"], predicted["Lower"][::-1]]),
+            fill="toself",
+            fillcolor="rgba(128, 128, 128, 0.2)",
+            line=dict(width=0),
+            hoverinfo="skip",
+            name=name + " (95% interval)"
+        ))
+        fig.add_trace(go.Scatter(
+            x=x,
+            y=predicted["Forecast"],
+            mode="lines+markers",
+            line=dict(dash="dash"),
+            name=name
+        ))
+
+    # forecasts cover the year, region and state filters up to the last year
+    # of data, not the incident characteristics or chart selections
+    forecast_model = load_forecast(data_version())
+    can_forecast = (
+        year[1] == forecast_model.last_year
+        and not tags
+        and all(rows is None for rows in (map_rows, city_rows, state_rows))
+    )
+    forecast_series = forecast.selection_series(forecast_model, states, us_region, state)
+    forecast_note = ("Forecasts repeat the " + str(forecast_model.last_year) + " level, spread over the months like "
+                     + str(forecast_model.first_year) + "-" + str(forecast_model.last_year) + ". The interval "
+                     + "covers year to year changes as large as those seen since " + str(forecast_model.first_year) + ".")
+
     # statistics on shown incidents
     col1, col2, col3, col4 = st.columns(4)
     col1.metric("Number of Incidents", filtered["Incident_ID"].count())
     col2.metric("Highest # of Injured", filtered["Victims_Injured"].max())
     col3.metric("Highest # of Killed", filtered["Victims_Killed"].max())
     col4.metric("Highest # of Total", filtered["Total_Victims"].max())  
-    # give option for color plotting
-    # then plot the map chart
-    color = st.selectbox(
-        "Pick a feature for the map's color sequence",
-        (
-            "Total_Victims",
-            "Victims_Injured",
-            "Victims_Killed",
-            "State_Political_Color",
-            "US_Region"
-        )
+    # the tables behind each chart, offered in the export section
+    chart_tables = {}
+
+    # plot every incident, or one shape per state colored by its rate
+    map_mode = st.radio(
+        "Map",
+        ("Incidents", "States"),
+        format_func=lambda mode: "Incident locations" if mode == "Incidents" else "State incident rates",
+        horizontal=True
     )
-    map_fig = create_scattermap(filtered, color)
-    st.plotly_chart(map_fig)
+    if map_mode == "Incidents":
+        # give option for color plotting
+        # then plot the map chart
+        color = st.selectbox(
+            "Pick a feature for the map's color sequence",
+            (
+                "Total_Victims",
+                "Victims_Injured",
+                "Victims_Killed",
+                "State_Political_Color",
+                "US_Region"
+            )
+        )
+        map_fig = create_scattermap(map_filtered, color)
+        st.plotly_chart(map_fig, key=chart_key("map"), on_select="rerun", selection_mode=("box", "lasso"))
+    else:
+        state_metric = st.selectbox(
+            "Pick a feature for the state colors",
+            list(choropleth.METRICS),
+            format_func=choropleth.METRICS.get
+        )
+        # the precomputed totals cover the year, region and state filters,
+        # narrower selections are totaled from the selected incidents
+        if tags or city_rows is not None or state_rows is not None:
+            state_totals = choropleth.rows_state_year(incidents, map_filtered)
+        else:
+            state_totals = load_state_totals(data_version())
+        rates = choropleth.state_rates(state_totals, load_state_population(), states,
+                                       year, us_region, state)
+        chart_tables["State incident rates"] = rates
+        st.plotly_chart(create_choropleth(rates, state_metric))
 
     # give option for location type
     # then plot the bar charts
     tab1, tab2, tab3, tab4 = st.tabs(["By City/County", "By State", "By Year", "By Month"])
 
     with tab1:
-        if pd.unique(filtered["City_or_County"]).size < 2:
+        if np.unique(label_codes(city_filtered, "City_or_County")[0]).size < 2:
             st.write("No city data to compare.")
         else:
-            total_bar_fig, num_bar_fig = create_bar(filtered=filtered, choice="City_or_County")
-            total_dist_fig, num_dist_fig = create_dist(filtered=filtered, choice="City_or_County")
-            incident_fig, incident_data = create_incidentchart(filtered=filtered, choice="City_or_County")
+            total_bar_fig, num_bar_fig, total_bar_data, num_bar_data = create_bar(filtered=city_filtered, choice="City_or_County")
+            total_dist_fig, num_dist_fig = create_dist(filtered=city_filtered, choice="City_or_County")
+            incident_fig, incident_data = create_incidentchart(filtered=city_filtered, choice="City_or_County")
+            chart_tables["Top 10 City/County by Total Victims"] = total_bar_data
+            chart_tables["Top 10 City/County by Number of Incidents"] = num_bar_data
+            chart_tables["Top 20 Incident Rates by City"] = incident_data
 
             city_col1, city_col2 = st.columns(2)
             with city_col1:
-                st.plotly_chart(total_bar_fig)
-                st.plotly_chart(num_bar_fig)
+                st.plotly_chart(total_bar_fig, key=chart_key("city_total_bar"), on_select="rerun", selection_mode="points")
+                st.plotly_chart(num_bar_fig, key=chart_key("city_num_bar"), on_select="rerun", selection_mode="points")
             
             with city_col2:
-                st.plotly_chart(total_dist_fig)
-                st.plotly_chart(num_dist_fig)
-            st.plotly_chart(incident_fig)
+                # keyed, small selections can give the city and state tabs identical plots
+                st.plotly_chart(total_dist_fig, key="city_total_dist")
+                st.plotly_chart(num_dist_fig, key="city_num_dist")
+            st.plotly_chart(incident_fig, key=chart_key("city_rate_bar"), on_select="rerun", selection_mode="points")
 
     with tab2:
-        if pd.unique(filtered["State_Name"]).size < 2:
+        if pd.unique(state_filtered["state_id"]).size < 2:
             st.write("No state data to compare.")
         else:
-            total_bar_fig, num_bar_fig = create_bar(filtered=filtered, choice="State_Name")
-            total_dist_fig, num_dist_fig = create_dist(filtered=filtered, choice="State_Name")
-            incident_fig, incident_data = create_incidentchart(filtered=filtered, choice="State_Name")
+            total_bar_fig, num_bar_fig, total_bar_data, num_bar_data = create_bar(filtered=state_filtered, choice="State_Name")
+            total_dist_fig, num_dist_fig = create_dist(filtered=state_filtered, choice="State_Name")
+            incident_fig, incident_data = create_incidentchart(filtered=state_filtered, choice="State_Name")
+            chart_tables["Top 10 State by Total Victims"] = total_bar_data
+            chart_tables["Top 10 State by Number of Incidents"] = num_bar_data
+            chart_tables["Top 20 Incident Rates by State"] = incident_data
             
             state_col1, state_col2 = st.columns(2)
             with state_col1:
-                st.plotly_chart(total_bar_fig)
-                st.plotly_chart(num_bar_fig)
+                st.plotly_chart(total_bar_fig, key=chart_key("state_total_bar"), on_select="rerun", selection_mode="points")
+                st.plotly_chart(num_bar_fig, key=chart_key("state_num_bar"), on_select="rerun", selection_mode="points")
             
             with state_col2:
-                st.plotly_chart(total_dist_fig)
-                st.plotly_chart(num_dist_fig)
-            st.plotly_chart(incident_fig)
+                st.plotly_chart(total_dist_fig, key="state_total_dist")
+                st.plotly_chart(num_dist_fig, key="state_num_dist")
+            st.plotly_chart(incident_fig, key=chart_key("state_rate_bar"), on_select="rerun", selection_mode="points")
 
     with tab3:
         year_feature_choice = st.selectbox(
@@ -479,6 +856,11 @@ else:
         )
         year_line, year_data1 = create_line(filtered=filtered, choice="Year", feature=year_feature_choice)
         year_dist, year_data2 = create_yeardist(filtered=filtered, feature=year_feature_choice)
+        chart_tables["By Year"] = year_data1
+        if can_forecast and st.checkbox("Forecast the next two years", help=forecast_note):
+            year_forecast = forecast.predict(forecast_model, forecast_series, year_feature_choice, by="Year")
+            add_forecast(year_line, year_forecast["Year"], year_forecast, "Forecast")
+            chart_tables["Forecast by Year"] = year_forecast
         
         year_col1, year_col2 = st.columns(2)
         with year_col1:
@@ -497,5 +879,55 @@ else:
             )
         )
         month_line, month_data = create_line(filtered=filtered, choice="Month", feature=month_feature_choice)
+        chart_tables["By Month"] = month_data.reset_index()
+        if can_forecast and st.checkbox("Forecast the next year", help=forecast_note):
+            month_forecast = forecast.predict(forecast_model, forecast_series, month_feature_choice, horizon=12)
+            add_forecast(month_line, month_forecast["Month"], month_forecast,
+                         "Forecast " + str(forecast_model.last_year + 1))
+            chart_tables["Forecast by Month"] = month_forecast
         st.plotly_chart(month_line)
 
+    # export the filtered incidents or the data behind a chart
+    st.header("Export the Data")
+    export_tables = {"Filtered incidents": filtered}
+    export_tables.update(chart_tables)
+
+    export_col1, export_col2 = st.columns(2)
+    export_choice = export_col1.selectbox("Pick a table to export", list(export_tables))
+    # only the incidents have coordinates for GeoJSON
+    export_formats = list(export.FORMATS) if export_choice == "Filtered incidents" else ["CSV", "Parquet"]
+    export_format = export_col2.selectbox("Pick a format", export_formats)
+
+    signature = {
+        "dataset": data_version(),
+        "year": year,
+        "us_region": sorted(us_region),
+        "state": sorted(state),
+        "characteristics": sorted(tags),
+        "characteristic_match": tag_match,
+        "map_selection": map_rows,
+        "city_selection": city_rows,
+        "state_selection": state_rows,
+        "map_mode": map_mode,
+        "table": export_choice,
+        "year_feature": year_feature_choice,
+        "month_feature": month_feature_choice,
+        "format": export_format,
+    }
+    # the file is only written when asked for, and the link lets the server
+    # stream it from disk instead of the page holding a copy in memory
+    export_path = export.export_path(export_format, signature)
+    if not export_path.exists() and st.button("Prepare export"):
+        export_table = export_tables[export_choice]
+        if export_choice == "Filtered incidents":
+            # the labels of the exported rows, in the layout of the merged csv
+            export_table = star.to_merged(incidents, export_table)
+        export.export(export_table, export_format, signature)
+    if export_path.exists():
+        extension, _ = export.FORMATS[export_format]
+        file_name = export_choice.lower().replace(" ", "_").replace("/", "_") + extension
+        st.markdown(
+            f'<a href="{export.url(export_path)}" download="{file_name}">Download {export_choice}</a>',
+            unsafe_allow_html=True
+        )
+
@@ -0,0 +1 @@
+# helpers shared by the Streamlit pages and the data curation scripts
@@ -0,0 +1,95 @@
+"""
+Streaming reader for the Census Bureau subcounty population estimates.
+
+The `sub-est*.csv` downloads are large and have one row per place, county
+part and minor civil division. Each vintage has one POPESTIMATE column per
+year it covers. The notebook read every vintage whole, wrote and re-read
+intermediate CSVs and then merged them wide. Here each file is read in chunks
+of only the NAME, STNAME and POPESTIMATE columns. Every chunk is reduced to
+distinct (place, year, estimate) rows right away, so memory is bounded by the
+number of places, not by the size of the download.
+
+The years come from the file header (`POPESTIMATE2024`, ...), so a new vintage
+works with no code changes. Drop it in data/ and it's picked up by
+`trends.pipeline`. When vintages cover the same year, the newest one wins,
+since each vintage revises the estimates before it.
+"""
+import re
+
+import pandas as pd
+
+ENCODING = "ISO-8859-1"
+CHUNK_ROWS = 100_000
+KEYS = ["NAME", "STNAME"]
+# POPESTIMATE2019 but not POPESTIMATE042020 (the April 1st base)
+ESTIMATE_COLUMN = re.compile(r"^POPESTIMATE(\d{4})$")
+
+
+def estimate_columns(path):
+    # {year: column} of the yearly estimates in the file's header
+    header = pd.read_csv(path, nrows=0, encoding=ENCODING).columns
+    years = {}
+    for column in header:
+        match = ESTIMATE_COLUMN.match(column)
+        if match:
+            years[int(match.group(1))] = column
+    if not years:
+        raise ValueError(f"{path} has no POPESTIMATE<year> columns")
+    return years
+
+
+def place_name(names):
+    # drop the last word of NAME since it's a classification ("city", "town")
+    # and not part of the actual name of the place. names repeat across the
+    # rows of a place, so only the distinct ones are split
+    names = names.astype("category")
+    stripped = names.cat.categories.str.rsplit(n=1).str[0].to_numpy()
+    return pd.Series(stripped[names.cat.codes.to_numpy()], index=names.index)
+
+
+def read_vintage(path, first_year, chunk_rows=CHUNK_ROWS):
+    # distinct (NAME, STNAME, Year, PopEstimate) rows for the years from
+    # first_year on, read chunk_rows rows at a time
+    years = {year: column for year, column in estimate_columns(path).items() if year >= first_year}
+    if not years:
+        return pd.DataFrame(columns=KEYS + ["Year", "PopEstimate"])
+    columns = {column: year for year, column in years.items()}
+
+    parts = []
+    reader = pd.read_csv(path, usecols=KEYS + list(columns), encoding=ENCODING,
+                         dtype={"NAME": "category", "STNAME": "category"}, chunksize=chunk_rows)
+    for chunk in reader:
+        chunk["NAME"] = place_name(chunk["NAME"])
+        chunk = chunk.rename(columns=columns).drop_duplicates()
+        long = chunk.melt(id_vars=KEYS, var_name="Year", value_name="PopEstimate").dropna()
+        parts.append(long)
+    long = pd.concat(parts, ignore_index=True).drop_duplicates(ignore_index=True)
+    long["STNAME"] = long["STNAME"].astype(str)
+    long["Year"] = long["Year"].astype("int64")
+    return long
+
+
+def city_population(sources, first_year=2014, chunk_rows=CHUNK_ROWS):
+    # population of each place in each year from first_year on, one row per
+    # (City_or_County, State_Name, Year). a place has to have an estimate for
+    # every year to be kept
+    vintages = {path: estimate_columns(path) for path in sources}
+    # newest vintage first, it gets the years it covers
+    order = sorted(vintages, key=lambda path: max(vintages[path]), reverse=True)
+
+    parts = []
+    claimed = set()
+    for path in order:
+        long = read_vintage(path, first_year, chunk_rows)
+        parts.append(long[~long["Year"].isin(claimed)])
+        claimed |= {year for year in vintages[path] if year >= first_year}
+    long = pd.concat(parts, ignore_index=True)
+
+    # a place can appear more than once per state (a city and the county
+    # parts it spans), average them out like the CONSOLIDATED query did
+    population = long.groupby(KEYS + ["Year"], as_index=False)["PopEstimate"].mean()
+    complete = population.groupby(KEYS)["Year"].transform("nunique") == len(claimed)
+    population = population[complete].astype({"PopEstimate": "int64"})
+    return population.rename(columns={
+        "NAME": "City_or_County", "STNAME": "State_Name", "PopEstimate": "City_PopEstimate",
+    }).sort_values(["State_Name", "City_or_County", "Year"], ignore_index=True)
@@ -0,0 +1,125 @@
+"""
+Inverted index over the Incident_Characteristics column of the raw incidents.
+
+Each incident in `mass-shootings-2014-2023.csv` lists its characteristics as
+newline-separated tags ("Shot - Wounded/Injured", "Drive-by (car to street,
+car to car)", ...). The tags are split once into a vocabulary, and every tag
+gets a sorted array of the Incident_IDs it appears on (its posting list).
+A query like "drive-by AND school" is then an intersection of two sorted
+integer arrays instead of a substring scan over the text of every incident.
+
+The posting lists are stored back to back in one array with the offset of
+each tag's list, and saved in data/.cache/characteristics keyed by the raw
+file's content hash. Build (or refresh) the index with:
+
+    python -m trends.characteristics
+"""
+import os
+import tempfile
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from trends import paths, store
+
+INDEX_DIR = paths.CACHE_DIR / "characteristics"
+COLUMN = "Incident_Characteristics"
+SEPARATOR = "\n"
+
+
+@dataclass(frozen=True)
+class Index:
+    # tags in alphabetical order
+    vocabulary: np.ndarray
+    # posting list of vocabulary[i] is ids[offsets[i]:offsets[i + 1]]
+    offsets: np.ndarray
+    ids: np.ndarray
+
+    def __len__(self):
+        return len(self.vocabulary)
+
+    def counts(self):
+        # number of incidents with each tag
+        return pd.Series(np.diff(self.offsets), index=self.vocabulary, name="count")
+
+    def postings(self, tag):
+        position = np.searchsorted(self.vocabulary, tag)
+        if position == len(self.vocabulary) or self.vocabulary[position] != tag:
+            raise ValueError(f"unknown characteristic: {tag!r}")
+        return self.ids[self.offsets[position]:self.offsets[position + 1]]
+
+
+def tokenize(frame):
+    # one row per (Incident_ID, tag), empty tags and repeats within an
+    # incident dropped
+    tags = frame[COLUMN].fillna("").str.split(SEPARATOR)
+    pairs = pd.DataFrame({"Incident_ID": frame["Incident_ID"].to_numpy(), "Tag": tags}).explode("Tag")
+    pairs["Tag"] = pairs["Tag"].str.strip()
+    pairs = pairs[pairs["Tag"].notna() & (pairs["Tag"] != "")]
+    return pairs.drop_duplicates(ignore_index=True)
+
+
+def build(frame):
+    pairs = tokenize(frame)
+    tag_id, vocabulary = pd.factorize(pairs["Tag"], sort=True)
+    ids = pairs["Incident_ID"].to_numpy().astype(np.int64)
+
+    # sorting by (tag, id) puts every posting list together, already sorted
+    order = np.lexsort((ids, tag_id))
+    offsets = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(np.bincount(tag_id, minlength=len(vocabulary)))
+    return Index(vocabulary=np.asarray(vocabulary, dtype=str), offsets=offsets, ids=ids[order])
+
+
+def query(index, tags, match="all"):
+    # sorted Incident_IDs having every tag (match="all") or any of them
+    # (match="any"), None if no tags are given
+    if not tags:
+        return None
+    postings = sorted((index.postings(tag) for tag in tags), key=len)
+    if match == "any":
+        return np.unique(np.concatenate(postings))
+    if match != "all":
+        raise ValueError(f"match must be 'all' or 'any', not {match!r}")
+    # start from the shortest list so every intersection is as small as it gets
+    ids = postings[0]
+    for posting in postings[1:]:
+        ids = np.intersect1d(ids, posting, assume_unique=True)
+    return ids
+
+
+def index_path(path):
+    return INDEX_DIR / f"{path.stem}-{store.version(path)}.npz"
+
+
+def save(index, target):
+    target.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=target.parent, suffix=".tmp")
+    with os.fdopen(fd, "wb") as f:
+        np.savez(f, vocabulary=index.vocabulary, offsets=index.offsets, ids=index.ids)
+    os.chmod(tmp, 0o644)
+    os.replace(tmp, target)
+
+
+def load(path=paths.RAW_INCIDENTS):
+    # the index of the csv at path, built the first time this version of the
+    # file is seen
+    target = index_path(path)
+    if not target.exists():
+        frame = pd.read_csv(path, usecols=["Incident_ID", COLUMN])
+        save(build(frame), target)
+    with np.load(target) as arrays:
+        return Index(vocabulary=arrays["vocabulary"], offsets=arrays["offsets"], ids=arrays["ids"])
+
+
+def main():
+    index = load()
+    counts = index.counts().sort_values(ascending=False)
+    print(f"{len(index)} characteristics, {len(index.ids)} postings")
+    with pd.option_context("display.max_colwidth", 90):
+        print(counts.to_string())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+"""
+Plotting modules for the pages, imported the first time a chart is drawn.
+
+plotly.express and plotly.figure_factory take a noticeable part of a page's
+cold start, and figure_factory pulls in scipy for the KDE curve of its
+distribution plots. Importing them from here instead of at the top of a page
+lets Streamlit send the title and text before any of that is loaded, and scipy
+is only loaded when a distribution plot is actually drawn.
+"""
+import importlib
+
+
+class LazyModule:
+    # stands in for a module until one of its attributes is used
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+    def __repr__(self):
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<lazy module {self._name!r} ({state})>"
+
+
+px = LazyModule("plotly.express")
+go = LazyModule("plotly.graph_objects")
+ff = LazyModule("plotly.figure_factory")
+
+
+def quantile_rank(values):
+    # rank of each value between 0 and 1, ties get their average rank. same as
+    # scipy.stats.rankdata(values, method='average') / len(values)
+    return values.rank(method="average", pct=True)
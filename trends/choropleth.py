@@ -0,0 +1,74 @@
+"""
+State-level incident rates for the choropleth mode of the Visualize map.
+
+The rates are rebuilt from two small per (state, year) tables: incident and
+victim totals, and the population estimates. Any year range and set of states
+is a filter and a group-by over at most 51 x 10 rows. The map gets one value
+per state, drawn on plotly's built-in state shapes, however many incidents
+were selected.
+
+This replaces `incident_rates_colored.csv`, which the SQL queries exported
+once for all the years and states, with rates that follow the filters.
+"""
+from trends.compare import FEATURES, VICTIMS
+from trends.star import resolve
+
+# two-letter codes plotly's "USA-states" location mode expects
+STATE_CODES = {
+    "Alabama": "AL", "Alaska": "AK", "Arizona": "AZ", "Arkansas": "AR", "California": "CA",
+    "Colorado": "CO", "Connecticut": "CT", "Delaware": "DE", "District of Columbia": "DC",
+    "Florida": "FL", "Georgia": "GA", "Hawaii": "HI", "Idaho": "ID", "Illinois": "IL",
+    "Indiana": "IN", "Iowa": "IA", "Kansas": "KS", "Kentucky": "KY", "Louisiana": "LA",
+    "Maine": "ME", "Maryland": "MD", "Massachusetts": "MA", "Michigan": "MI", "Minnesota": "MN",
+    "Mississippi": "MS", "Missouri": "MO", "Montana": "MT", "Nebraska": "NE", "Nevada": "NV",
+    "New Hampshire": "NH", "New Jersey": "NJ", "New Mexico": "NM", "New York": "NY",
+    "North Carolina": "NC", "North Dakota": "ND", "Ohio": "OH", "Oklahoma": "OK", "Oregon": "OR",
+    "Pennsylvania": "PA", "Rhode Island": "RI", "South Carolina": "SC", "South Dakota": "SD",
+    "Tennessee": "TN", "Texas": "TX", "Utah": "UT", "Vermont": "VT", "Virginia": "VA",
+    "Washington": "WA", "West Virginia": "WV", "Wisconsin": "WI", "Wyoming": "WY",
+}
+
+# column of state_rates -> label on the map
+METRICS = {
+    "Incident_Rate": "Yearly incidents per 100K residents",
+    "Victim_Rate": "Yearly victims per 100K residents",
+    "State_Political_Color": "Political color",
+}
+
+
+def state_year(cube):
+    # incident and victim totals per (state, year) from the (state, year,
+    # month) cube of trends/compare.py
+    return cube.groupby(["State_Name", "Year"], as_index=False)[FEATURES].sum()
+
+
+def rows_state_year(star, fact):
+    # the same totals from fact rows of the star schema, for selections the
+    # cube can't answer (incident characteristics, chart selections)
+    grouped = fact.groupby(["state_id", "Year"])
+    totals = grouped[VICTIMS].sum()
+    totals["Num_Incidents"] = grouped.size()
+    totals = resolve(star, totals.reset_index(), ["State_Name"])
+    return totals[["State_Name", "Year"] + FEATURES]
+
+
+def state_rates(totals, population, states, year, us_region, state):
+    # one row per selected state with its average yearly incident and victim
+    # rates per 100K residents over the year range. states without incidents
+    # in the selection get a rate of 0
+    picked = states[states["US_Region"].isin(us_region) & states["State_Name"].isin(state)]
+    years = population["Year"].between(*year) & population["State_Name"].isin(picked["State_Name"])
+    residents = population[years].groupby("State_Name")["Population"].mean()
+
+    in_range = totals["Year"].between(*year) & totals["State_Name"].isin(picked["State_Name"])
+    counts = totals[in_range].groupby("State_Name")[FEATURES].sum().reindex(residents.index, fill_value=0)
+
+    num_years = year[1] - year[0] + 1
+    rates = picked.set_index("State_Name").loc[residents.index].reset_index()
+    rates["State_Code"] = rates["State_Name"].map(STATE_CODES)
+    rates["Num_Incidents"] = counts["Num_Incidents"].to_numpy()
+    rates["Total_Victims"] = counts["Total_Victims"].to_numpy()
+    rates["Avg_Population"] = residents.to_numpy()
+    rates["Incident_Rate"] = rates["Num_Incidents"] / num_years / rates["Avg_Population"] * 100000
+    rates["Victim_Rate"] = rates["Total_Victims"] / num_years / rates["Avg_Population"] * 100000
+    return rates.sort_values("Incident_Rate", ascending=False, ignore_index=True)
@@ -0,0 +1,112 @@
+"""
+Aggregates for comparing two selections side by side in the Visualize page.
+
+Every statistic the comparison shows can be rebuilt from per (state, year,
+month) totals, so the incidents are aggregated once into that small cube and
+both selections are answered from it with a boolean mask. Comparing two
+selections costs about the same as showing one.
+"""
+import pandas as pd
+
+from trends import paths
+from trends.star import resolve
+
+KEYS = ["State_Name", "US_Region", "State_Political_Color", "Year", "Month"]
+VICTIMS = ["Total_Victims", "Victims_Injured", "Victims_Killed"]
+FEATURES = ["Num_Incidents"] + VICTIMS
+
+
+def build_cube(star):
+    # incident count, victim totals and the largest incident per (state, year,
+    # month). the group-by runs on the integer keys of the star schema and the
+    # state labels are joined onto the (much smaller) result
+    grouped = star.fact.groupby(["state_id", "Year", "Month"])
+    cube = grouped[VICTIMS].sum().astype("int64")
+    cube["Num_Incidents"] = grouped.size()
+    for col in VICTIMS:
+        cube["Max_" + col] = grouped[col].max().astype("int64")
+    cube = cube.reset_index()
+    cube = resolve(star, cube, ["State_Name", "US_Region", "State_Political_Color"])
+    cube["Year"] = cube["Year"].astype("int64")
+    cube["Month"] = cube["Month"].astype("int64")
+    return cube[KEYS + FEATURES + ["Max_" + col for col in VICTIMS]]
+
+
+def load_state_population(path=paths.STATE_POPULATION):
+    # population of every state for every year, including the years a state
+    # had no incidents
+    wide = pd.read_csv(path)
+    long = wide.melt(id_vars="NAME", var_name="Year", value_name="Population")
+    long["Year"] = long["Year"].str[-4:].astype(int)
+    return long.rename(columns={"NAME": "State_Name"})
+
+
+def cube_mask(cube, year, us_region, state, colors):
+    return (
+        cube["US_Region"].isin(us_region)
+        & cube["State_Name"].isin(state)
+        & cube["State_Political_Color"].isin(colors)
+        & cube["Year"].between(year[0], year[1])
+    )
+
+
+def population_mask(population, states, year, us_region, state, colors):
+    # same selection on the (state, year) population table
+    selected = states[
+        states["US_Region"].isin(us_region)
+        & states["State_Name"].isin(state)
+        & states["State_Political_Color"].isin(colors)
+    ]
+    return population["State_Name"].isin(selected["State_Name"]) & population["Year"].between(*year)
+
+
+def metrics(cube, mask):
+    picked = cube[mask]
+    result = {feature: int(picked[feature].sum()) for feature in FEATURES}
+    for col in VICTIMS:
+        result["Max_" + col] = int(picked["Max_" + col].max()) if len(picked) else 0
+    return result
+
+
+def by_year(cube, masks, feature):
+    # one row per year and selection
+    frames = [
+        cube[mask].groupby("Year")[feature].sum().reset_index().assign(Selection=name)
+        for name, mask in masks.items()
+    ]
+    return pd.concat(frames, ignore_index=True)
+
+
+def by_month(cube, masks, feature, years):
+    # average per year for each month, so selections covering a different
+    # number of years can be compared. years maps each selection to its
+    # (first, last) year, years without incidents still count
+    frames = []
+    for name, mask in masks.items():
+        first, last = years[name]
+        picked = cube[mask]
+        month = (picked.groupby("Month")[feature].sum() / (last - first + 1)).reindex(range(1, 13), fill_value=0)
+        frames.append(month.rename_axis("Month").reset_index().assign(Selection=name))
+    return pd.concat(frames, ignore_index=True)
+
+
+def incident_rates(cube, population, pop_masks, masks, by="US_Region", states=None):
+    # average yearly incidents per 100K residents of each group, one column per
+    # selection plus the difference between the last and the first selection.
+    # the "All" row covers the whole selection, so selections without a group
+    # in common (red against blue states) still get a difference
+    rates = {}
+    for name, mask in masks.items():
+        incidents = cube[mask].groupby(by)["Num_Incidents"].sum()
+        residents = population[pop_masks[name]]
+        if by != "State_Name":
+            residents = residents.merge(states[["State_Name", by]], on="State_Name")
+        residents = residents.groupby(by)["Population"].sum()
+        incidents = incidents.reindex(residents.index, fill_value=0)
+        incidents["All"] = incidents.sum()
+        residents["All"] = residents.sum()
+        rates[name] = (incidents / residents) * 100000
+    rates = pd.DataFrame(rates).rename_axis(by)
+    names = list(masks)
+    rates["Difference"] = rates[names[-1]] - rates[names[0]]
+    return rates.reset_index()
@@ -0,0 +1,143 @@
+"""
+Export the incidents selected in the Visualize page, and the tables behind its
+charts, as CSV, Parquet or GeoJSON.
+
+Files are written a chunk of rows at a time so a large selection is never held
+in memory as one big string, and they're cached in static/exports by a
+signature of the dataset and the filters that produced them. Asking for the
+same selection again just returns the file that's already there.
+
+A file is only written when it's asked for, and the page links to it in
+static/, which the Streamlit server streams from disk. The page never reads the
+file back into memory to hand it to the browser.
+"""
+import hashlib
+import json
+import os
+import tempfile
+
+import numpy as np
+import pyarrow as pa
+
+from trends import paths
+
+EXPORT_DIR = paths.STATIC_DIR / "exports"
+CHUNK_ROWS = 50_000
+# oldest exports are removed once there are more than this many
+MAX_EXPORTS = 64
+
+FORMATS = {
+    "CSV": (".csv", "text/csv"),
+    "Parquet": (".parquet", "application/vnd.apache.parquet"),
+    "GeoJSON": (".geojson", "application/geo+json"),
+}
+
+
+def encode(value):
+    # row position arrays are hashed rather than written out in full
+    if isinstance(value, np.ndarray):
+        return hashlib.sha256(np.ascontiguousarray(value).tobytes()).hexdigest()
+    return str(value)
+
+
+def signature_key(signature):
+    # stable hash of a json serializable description of the selection
+    text = json.dumps(signature, sort_keys=True, default=encode)
+    return hashlib.sha256(text.encode()).hexdigest()[:24]
+
+
+def chunks(frame, chunk_rows):
+    for start in range(0, len(frame), chunk_rows):
+        yield frame.iloc[start:start + chunk_rows]
+
+
+def write_csv(frame, f, chunk_rows):
+    if frame.empty:
+        frame.to_csv(f, index=False)
+    for i, chunk in enumerate(chunks(frame, chunk_rows)):
+        chunk.to_csv(f, header=(i == 0), index=False)
+
+
+def write_parquet(frame, f, chunk_rows):
+    import pyarrow.parquet as pq
+
+    # one row group per chunk, the schema comes from the first chunk. object
+    # columns that are empty there are assumed to hold strings
+    schema = pa.Schema.from_pandas(frame.iloc[:chunk_rows], preserve_index=False)
+    for i, col in enumerate(schema):
+        if pa.types.is_null(col.type):
+            schema = schema.set(i, col.with_type(pa.string()))
+    with pq.ParquetWriter(f, schema) as writer:
+        for chunk in chunks(frame, chunk_rows):
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+
+
+def write_geojson(frame, f, chunk_rows, lat="Latitude", lon="Longitude"):
+    # a FeatureCollection of points, every other column becomes a property
+    properties = [col for col in frame.columns if col not in (lat, lon)]
+    f.write(b'{"type": "FeatureCollection", "features": [\n')
+    first = True
+    for chunk in chunks(frame, chunk_rows):
+        # object dtype turns numpy scalars into python ones and NaN into None
+        values = chunk[properties].astype(object)
+        values = values.where(chunk[properties].notna(), None)
+        lines = []
+        for props, y, x in zip(values.to_dict("records"), chunk[lat].tolist(), chunk[lon].tolist()):
+            feature = {
+                "type": "Feature",
+                "geometry": {"type": "Point", "coordinates": [x, y]},
+                "properties": props,
+            }
+            lines.append(json.dumps(feature, default=str))
+        if lines:
+            f.write((("" if first else ",\n") + ",\n".join(lines)).encode())
+            first = False
+    f.write(b"\n]}\n")
+
+
+WRITERS = {
+    "CSV": write_csv,
+    "Parquet": write_parquet,
+    "GeoJSON": write_geojson,
+}
+
+
+def prune(keep=MAX_EXPORTS):
+    extensions = {extension for extension, _ in FORMATS.values()}
+    files = [path for path in EXPORT_DIR.iterdir() if path.suffix in extensions]
+    files.sort(key=lambda path: path.stat().st_mtime, reverse=True)
+    for path in files[keep:]:
+        path.unlink(missing_ok=True)
+
+
+def export_path(fmt, signature):
+    # where the export of that selection is (or will be) cached
+    if fmt not in FORMATS:
+        raise ValueError(f"unknown format {fmt!r}, expected one of {list(FORMATS)}")
+    extension, _ = FORMATS[fmt]
+    return EXPORT_DIR / (signature_key(signature) + extension)
+
+
+def url(path):
+    # relative url the Streamlit server serves the exported file at
+    return "app/static/" + path.relative_to(paths.STATIC_DIR).as_posix()
+
+
+def export(frame, fmt, signature, chunk_rows=CHUNK_ROWS):
+    # path of the exported file, written only if it isn't cached yet
+    target = export_path(fmt, signature)
+    if target.exists():
+        return target
+
+    EXPORT_DIR.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=EXPORT_DIR, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            WRITERS[fmt](frame, f, chunk_rows)
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, target)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    prune()
+    return target
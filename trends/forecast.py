@@ -0,0 +1,238 @@
+"""
+Seasonal forecasts of the monthly incident and victim counts.
+
+The forecast is seasonal naive: every coming year repeats the level of the
+last year, spread over the months like the fitted years were. Trends fitted
+to 2014-2023 don't hold up. The counts jumped in 2020 and have been flat
+since, so extrapolating a log-linear trend put the next years well above
+anything seen. Repeating the last year was the most accurate choice in the
+backtest below.
+
+The intervals come from how much the yearly totals moved from one year to the
+next (the spread of their log changes), so a year like 2020 is part of the
+uncertainty. The level is treated as a random walk, so the interval widens
+with every year ahead, and the monthly intervals add the month to month noise
+on top (quasi-Poisson).
+
+The counts of a selection of states add up, so a selection is forecast from
+the sum of its series' monthly counts: the regions when the selection is made
+of whole regions, the states otherwise.
+
+`backtest` refits on the years up to each past year, forecasts the years
+after it and reports how often the actual counts fell inside the 95%
+intervals. The monthly counts of every state and region are saved in
+data/.cache/forecast, keyed by the version of the merged dataset. Build them
+and print the forecasts and the backtest with:
+
+    python -m trends.forecast
+"""
+import os
+import tempfile
+from dataclasses import dataclass, replace
+
+import numpy as np
+import pandas as pd
+
+from trends import compare, paths, star, store
+
+FORECAST_DIR = paths.CACHE_DIR / "forecast"
+HORIZON = 24
+# added to every month when working out the seasonal shares, so a selection
+# with few incidents isn't forecast to have none in the months it had none
+SMOOTHING = 1.0
+# added to the yearly totals before taking logs, for years without incidents
+OFFSET = 0.5
+# a forecast needs at least this many years of counts, the backtest starts
+# from the first year it can forecast
+MIN_YEARS = 4
+LEVEL = 0.95
+
+
+@dataclass(frozen=True)
+class Model:
+    features: np.ndarray
+    # level ("region" or "state") and name of each series
+    levels: np.ndarray
+    names: np.ndarray
+    # (feature, series, month) counts of every month from first_year to last_year
+    counts: np.ndarray
+    first_year: int
+    last_year: int
+
+    def series(self, level, names):
+        # positions of the named series of that level
+        picked = (self.levels == level) & np.isin(self.names, list(names))
+        return np.flatnonzero(picked)
+
+    def until(self, last_year):
+        # the same model fitted on the years up to last_year only
+        months = (last_year - self.first_year + 1) * 12
+        return replace(self, counts=self.counts[..., :months], last_year=last_year)
+
+
+def monthly_series(cube):
+    # (feature, series, month) array of counts with every month of the cube's
+    # years, zeros included, and the level and name of each series
+    first_year, last_year = int(cube["Year"].min()), int(cube["Year"].max())
+    months = pd.MultiIndex.from_product(
+        [range(first_year, last_year + 1), range(1, 13)], names=["Year", "Month"])
+
+    counts, levels, names = [], [], []
+    for level, column in (("region", "US_Region"), ("state", "State_Name")):
+        table = cube.groupby([column, "Year", "Month"])[compare.FEATURES].sum()
+        for name in sorted(cube[column].unique()):
+            counts.append(table.loc[name].reindex(months, fill_value=0).to_numpy().T)
+            levels.append(level)
+            names.append(name)
+    counts = np.stack(counts, axis=1).astype(float)
+    return counts, np.array(levels), np.array(names), first_year, last_year
+
+
+def fit(cube):
+    counts, levels, names, first_year, last_year = monthly_series(cube)
+    return Model(
+        features=np.array(compare.FEATURES),
+        levels=levels,
+        names=names,
+        counts=counts,
+        first_year=first_year,
+        last_year=last_year,
+    )
+
+
+def selection_series(model, states, us_region, state):
+    # the series whose sum is the selection: whole regions if the selected
+    # states are exactly the states of the selected regions, else the states
+    picked = states[states["US_Region"].isin(us_region) & states["State_Name"].isin(state)]
+    regions = picked["US_Region"].unique()
+    if set(picked["State_Name"]) == set(states.loc[states["US_Region"].isin(regions), "State_Name"]):
+        return model.series("region", regions)
+    return model.series("state", picked["State_Name"])
+
+
+def predict(model, series, feature, by="Month", horizon=HORIZON):
+    # forecast of the sum of the series for the horizon months after the
+    # fitted period, per month or per year, with a 95% interval
+    from scipy import stats
+
+    f = int(np.flatnonzero(model.features == feature)[0])
+    monthly = model.counts[f, series].sum(axis=0).reshape(-1, 12)
+    yearly = monthly.sum(axis=1)
+    if len(yearly) < MIN_YEARS:
+        raise ValueError(f"need at least {MIN_YEARS} years of counts to forecast, got {len(yearly)}")
+
+    # spread of the yearly log changes, with a t quantile since there are
+    # only a handful of them
+    changes = np.diff(np.log(yearly + OFFSET))
+    sigma = np.sqrt((changes ** 2).mean())
+    q = stats.t.ppf((1 + LEVEL) / 2, len(changes))
+
+    future = pd.DataFrame({
+        "Year": model.last_year + 1 + np.arange(horizon) // 12,
+        "Month": np.arange(horizon) % 12 + 1,
+    })
+    level = yearly[-1]
+
+    if by == "Year":
+        keys = future[["Year"]].drop_duplicates().reset_index(drop=True)
+        spread = q * sigma * np.sqrt(keys["Year"] - model.last_year)
+        return keys.assign(
+            Forecast=level,
+            Lower=np.maximum((level + OFFSET) * np.exp(-spread) - OFFSET, 0),
+            Upper=(level + OFFSET) * np.exp(spread) - OFFSET,
+        )
+
+    # share of the year that falls in each month, and how much more the
+    # months vary around it than Poisson counts would
+    shares = (monthly.sum(axis=0) + SMOOTHING) / (yearly.sum() + 12 * SMOOTHING)
+    expected = np.maximum(yearly[:, None] * shares, 1e-9)
+    pearson = ((monthly - expected) ** 2 / expected).sum() / max(monthly.size - len(yearly) - 11, 1)
+    dispersion = max(pearson, 1.0)
+
+    mu = level * shares[future["Month"] - 1]
+    years_ahead = (future["Year"] - model.last_year).to_numpy()
+    variance = mu ** 2 * np.expm1(sigma ** 2 * years_ahead) + dispersion * mu
+    sd = np.sqrt(variance)
+    return future.assign(
+        Forecast=mu,
+        Lower=np.maximum(mu - q * sd, 0),
+        Upper=mu + q * sd,
+    )
+
+
+def backtest(model, horizon=HORIZON):
+    # fit on the years up to each past year, forecast the years after it and
+    # check the forecasts against what happened. one row per level ("us",
+    # "region", "state"), forecast kind and number of years ahead with the
+    # share of actual counts inside the 95% interval and the mean absolute error
+    targets = [("us", model.series("region", model.names[model.levels == "region"]))]
+    targets += [(level, np.array([s])) for s, level in enumerate(model.levels)]
+
+    rows = []
+    for origin in range(model.first_year + MIN_YEARS - 1, model.last_year):
+        fitted = model.until(origin)
+        months = min(horizon, (model.last_year - origin) * 12)
+        actual = model.counts[..., (origin - model.first_year + 1) * 12:][..., :months]
+        for f, feature in enumerate(model.features):
+            for level, series in targets:
+                observed = actual[f, series].sum(axis=0)
+                for by, values in (("Year", observed.reshape(-1, 12).sum(axis=1)), ("Month", observed)):
+                    predicted = predict(fitted, series, feature, by=by, horizon=months)
+                    rows.append(pd.DataFrame({
+                        "Level": level,
+                        "By": by,
+                        "Years_Ahead": predicted["Year"] - origin,
+                        "Inside": (values >= predicted["Lower"]) & (values <= predicted["Upper"]),
+                        "Error": np.abs(values - predicted["Forecast"]),
+                    }))
+    results = pd.concat(rows, ignore_index=True)
+    return results.groupby(["Level", "By", "Years_Ahead"]).agg(
+        Forecasts=("Inside", "size"),
+        Coverage=("Inside", "mean"),
+        Mean_Abs_Error=("Error", "mean"),
+    ).reset_index()
+
+
+def model_path(path):
+    return FORECAST_DIR / f"{path.stem}-{store.version(path)}-counts.npz"
+
+
+def save(model, target):
+    target.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=target.parent, suffix=".tmp")
+    with os.fdopen(fd, "wb") as f:
+        np.savez(f, features=model.features, levels=model.levels, names=model.names,
+                 counts=model.counts, years=np.array([model.first_year, model.last_year]))
+    os.chmod(tmp, 0o644)
+    os.replace(tmp, target)
+
+
+def load(path=paths.MERGED_INCIDENTS):
+    # the model of the dataset at path, built the first time this version of
+    # the file is seen
+    target = model_path(path)
+    if not target.exists():
+        save(fit(compare.build_cube(star.attach(path))), target)
+    with np.load(target) as arrays:
+        first_year, last_year = (int(year) for year in arrays["years"])
+        return Model(
+            features=arrays["features"], levels=arrays["levels"], names=arrays["names"],
+            counts=arrays["counts"], first_year=first_year, last_year=last_year,
+        )
+
+
+def main():
+    model = load()
+    regions = model.series("region", model.names[model.levels == "region"])
+    print(f"{len(model.names)} series ({len(regions)} regions), "
+          f"{model.first_year}-{model.last_year}")
+    with pd.option_context("display.width", 120):
+        for feature in model.features:
+            print(f"\n{feature}, all regions")
+            print(predict(model, regions, feature, by="Year").round(1).to_string(index=False))
+        print("\nbacktest, share of actual counts inside the 95% intervals")
+        print(backtest(model).round(3).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
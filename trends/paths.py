@@ -0,0 +1,37 @@
+from pathlib import Path
+
+# every dataset lives in data/ at the root of the repo, next to the pages
+ROOT_DIR = Path(__file__).resolve().parent.parent
+DATA_DIR = ROOT_DIR / "data"
+
+RAW_INCIDENTS = DATA_DIR / "mass-shootings-2014-2023.csv"
+CITY_NOT_FIXED_INCIDENTS = DATA_DIR / "city_not_fixed_mass_shootings_2014-2023.csv"
+CLEANED_INCIDENTS = DATA_DIR / "cleaned_mass_shootings_2014-2023.csv"
+MERGED_INCIDENTS = DATA_DIR / "merged_mass_shootings_2014-2023.csv"
+
+STATE_POPULATION = DATA_DIR / "cleaned_state_est_2014_2023.csv"
+PRESIDENT = DATA_DIR / "cleaned_president_2012_2020.csv"
+STATE_PARTY_COLOR = DATA_DIR / "state_party_color.csv"
+# election years, rule and margin state_party_color.csv was derived with
+POLITICAL_CONFIG = DATA_DIR / "political_color.json"
+INCIDENT_RATES_COLORED = DATA_DIR / "incident_rates_colored.csv"
+# one row per (City_or_County, State_Name, Year)
+CITY_POPULATION = DATA_DIR / "cleaned_city_population.csv"
+
+# raw downloads, these are too large to commit and are only needed to rebuild
+# the curated datasets above
+RAW_STATE_POPULATION_2019 = DATA_DIR / "nst-est2019-alldata.csv"
+RAW_STATE_POPULATION_2023 = DATA_DIR / "NST-EST2023-ALLDATA.csv"
+RAW_CITY_POPULATION_2019 = DATA_DIR / "sub-est2019_all.csv"
+RAW_CITY_POPULATION_2023 = DATA_DIR / "sub-est2023.csv"
+# every subcounty estimates vintage that has been downloaded, so a newer one
+# (sub-est2024.csv) is used as soon as it's in data/
+RAW_CITY_POPULATION = sorted(DATA_DIR.glob("sub-est*.csv")) or [RAW_CITY_POPULATION_2019, RAW_CITY_POPULATION_2023]
+RAW_PRESIDENT = DATA_DIR / "1976-2020-president.csv"
+
+# columnar copies of the curated datasets and the pipeline bookkeeping
+CACHE_DIR = DATA_DIR / ".cache"
+
+# files the Streamlit server hands out by url (app/static/...), it's only
+# served with server.enableStaticServing in .streamlit/config.toml
+STATIC_DIR = ROOT_DIR / "static"
@@ -0,0 +1,306 @@
+"""
+A small make-style runner for the data curation steps in `trends.stages`.
+
+Each stage declares the files it reads and writes. A stage is skipped when the
+content hashes of its inputs (and outputs) match the last successful run, and
+stages that don't depend on each other run in parallel worker processes.
+
+A stage whose inputs aren't all there keeps its existing outputs. If it has a
+`partial` step, that step still brings the outputs up to date with the inputs
+that are there (the merged incidents get new political colours without the
+census downloads).
+
+Curated datasets are still written as CSV since that's what gets committed and
+what the pages read, but every output is also stored as an Arrow (feather) file
+in data/.cache, keyed by the content hash of the CSV. Downstream stages load
+that columnar copy instead of parsing the CSV again.
+
+Run from the root of the repo:
+
+    python -m trends.pipeline               # rebuild whatever is out of date
+    python -m trends.pipeline merged        # only merged and what it needs
+    python -m trends.pipeline --force       # rebuild everything
+    python -m trends.pipeline --list
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import pandas as pd
+
+from trends import paths
+
+STATE_FILE = paths.CACHE_DIR / "pipeline_state.json"
+
+
+@dataclass(frozen=True)
+class Stage:
+    name: str
+    func: object
+    inputs: tuple
+    outputs: tuple
+    # extra pd.read_csv arguments for inputs that are parsed from csv
+    read_options: dict = field(default_factory=dict)
+    # pass the input paths instead of loaded tables, for stages that read
+    # large inputs in chunks themselves
+    stream: bool = False
+    # run instead of func when some inputs are missing but the outputs exist:
+    # partial(*partial_inputs, *outputs) returns the updated outputs
+    partial: object = None
+    partial_inputs: tuple = ()
+
+
+def file_hash(path, stat_cache=None):
+    # sha256 of the file content. stat_cache maps path -> [size, mtime, hash] so
+    # that a file which wasn't touched since the last run isn't read again
+    path = Path(path)
+    stat = path.stat()
+    key = str(path)
+    if stat_cache is not None:
+        cached = stat_cache.get(key)
+        if cached and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+            return cached[2]
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    content_hash = digest.hexdigest()
+
+    if stat_cache is not None:
+        stat_cache[key] = [stat.st_size, stat.st_mtime_ns, content_hash]
+    return content_hash
+
+
+def columnar_path(path, content_hash):
+    return paths.CACHE_DIR / f"{Path(path).stem}-{content_hash[:16]}.feather"
+
+
+def read_table(path, read_options=None, content_hash=None):
+    # prefer the feather copy written when the csv was produced
+    if content_hash is None:
+        content_hash = file_hash(path)
+    cached = columnar_path(path, content_hash)
+    if cached.exists():
+        return pd.read_feather(cached)
+    return pd.read_csv(path, **(read_options or {}))
+
+
+def write_table(frame, path):
+    # write the csv everyone reads plus its columnar copy, returns the csv hash
+    frame = frame.reset_index(drop=True)
+    frame.to_csv(path, index=False)
+    content_hash = file_hash(path)
+    paths.CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    # uncompressed so trends.store can memory map it
+    frame.to_feather(columnar_path(path, content_hash), compression="uncompressed")
+    return content_hash
+
+
+def execute(stage, input_hashes, partial=False):
+    # runs in a worker process
+    if partial:
+        func = stage.partial
+        frames = [
+            read_table(path, stage.read_options.get(path))
+            for path in stage.partial_inputs + stage.outputs
+        ]
+    elif stage.stream:
+        func = stage.func
+        frames = [Path(path) for path in stage.inputs]
+    else:
+        func = stage.func
+        frames = [
+            read_table(path, stage.read_options.get(path), input_hashes[str(path)])
+            for path in stage.inputs
+        ]
+    result = func(*frames)
+    if not isinstance(result, tuple):
+        result = (result,)
+    if len(result) != len(stage.outputs):
+        raise ValueError(
+            f"stage {stage.name} returned {len(result)} table(s) "
+            f"but declares {len(stage.outputs)} output(s)"
+        )
+    return {str(path): write_table(frame, path) for frame, path in zip(result, stage.outputs)}
+
+
+def load_state():
+    if STATE_FILE.exists():
+        return json.loads(STATE_FILE.read_text())
+    return {"files": {}, "stages": {}}
+
+
+def save_state(state):
+    STATE_FILE.parent.mkdir(parents=True, exist_ok=True)
+    tmp = STATE_FILE.with_suffix(".tmp")
+    tmp.write_text(json.dumps(state, indent=1, sort_keys=True))
+    os.replace(tmp, STATE_FILE)
+
+
+def producers(stages):
+    # output path -> stage that writes it
+    produced_by = {}
+    for stage in stages:
+        for path in stage.outputs:
+            if str(path) in produced_by:
+                raise ValueError(f"{path} is written by more than one stage")
+            produced_by[str(path)] = stage
+    return produced_by
+
+
+def upstream(stages, targets):
+    # the target stages and every stage they depend on, in declaration order
+    by_name = {stage.name: stage for stage in stages}
+    unknown = [name for name in targets if name not in by_name]
+    if unknown:
+        raise ValueError(f"unknown stage(s) {unknown}, expected some of {sorted(by_name)}")
+
+    produced_by = producers(stages)
+    needed = set()
+    todo = list(targets)
+    while todo:
+        name = todo.pop()
+        if name in needed:
+            continue
+        needed.add(name)
+        todo.extend(
+            produced_by[str(path)].name
+            for path in by_name[name].inputs
+            if str(path) in produced_by
+        )
+    return [stage for stage in stages if stage.name in needed]
+
+
+def run(stages, targets=None, force=False, jobs=None, log=print):
+    # returns {stage name: "ran" | "updated" | "up to date" | "kept" | "blocked"}
+    if targets:
+        stages = upstream(stages, targets)
+    produced_by = producers(stages)
+    state = load_state()
+    stat_cache = state["files"]
+    status = {}
+
+    def deps(stage):
+        return {produced_by[str(path)].name for path in stage.inputs
+                if str(path) in produced_by}
+
+    def changed(stage, inputs):
+        # input hashes if stage has to run on inputs, None if it's up to date
+        input_hashes = {str(path): file_hash(path, stat_cache) for path in inputs}
+        previous = state["stages"].get(stage.name)
+        if not force and previous and previous["inputs"] == input_hashes:
+            outputs = previous["outputs"]
+            if all(Path(path).exists() and file_hash(path, stat_cache) == outputs.get(str(path))
+                   for path in stage.outputs):
+                return None
+        return input_hashes
+
+    def check(stage):
+        # decide whether stage has to run, and on which inputs
+        missing = [Path(path).name for path in stage.inputs if not Path(path).exists()]
+        if missing:
+            # the raw downloads aren't committed, keep the curated outputs if
+            # they are there, updated by the partial step if the stage has one
+            if all(Path(path).exists() for path in stage.outputs):
+                if stage.partial and all(Path(path).exists() for path in stage.partial_inputs):
+                    input_hashes = changed(stage, stage.partial_inputs)
+                    if input_hashes is None:
+                        return "kept", None
+                    log(f"{stage.name}: updating existing outputs, missing {', '.join(missing)}")
+                    return "update", input_hashes
+                log(f"{stage.name}: kept existing outputs, missing {', '.join(missing)}")
+                return "kept", None
+            log(f"{stage.name}: can't run, missing {', '.join(missing)}")
+            return "blocked", None
+
+        input_hashes = changed(stage, stage.inputs)
+        if input_hashes is None:
+            return "up to date", None
+        return "run", input_hashes
+
+    pending = {stage.name: stage for stage in stages}
+    running = {}
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        while pending or running:
+            for name, stage in list(pending.items()):
+                if deps(stage) & (set(pending) | {item[0] for item in running.values()}):
+                    continue
+                del pending[name]
+                decision, input_hashes = check(stage)
+                if decision not in ("run", "update"):
+                    status[name] = decision
+                    continue
+                if decision == "run":
+                    log(f"{name}: running")
+                future = pool.submit(execute, stage, input_hashes, decision == "update")
+                running[future] = (name, input_hashes, time.perf_counter(), decision)
+
+            if not running:
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name, input_hashes, started, decision = running.pop(future)
+                output_hashes = future.result()
+                for path in output_hashes:
+                    # refresh the stat cache entry for the file just written
+                    stat_cache.pop(path, None)
+                    file_hash(path, stat_cache)
+                state["stages"][name] = {
+                    "inputs": input_hashes,
+                    "outputs": output_hashes,
+                }
+                save_state(state)
+                status[name] = "ran" if decision == "run" else "updated"
+                log(f"{name}: done in {time.perf_counter() - started:.2f}s")
+
+    save_state(state)
+    return status
+
+
+def main(argv=None):
+    from trends.stages import STAGES
+
+    parser = argparse.ArgumentParser(description="Rebuild the curated datasets in data/.")
+    parser.add_argument("stages", nargs="*", help="stages to bring up to date (default: all)")
+    parser.add_argument("--force", action="store_true", help="rerun stages even if unchanged")
+    parser.add_argument("--jobs", type=int, default=None, help="number of worker processes")
+    parser.add_argument("--list", action="store_true", help="list the stages and exit")
+    parser.add_argument("--no-validate", action="store_true",
+                        help="skip checking the datasets once they are built")
+    args = parser.parse_args(argv)
+
+    if args.list:
+        for stage in STAGES:
+            inputs = ", ".join(Path(path).name for path in stage.inputs)
+            outputs = ", ".join(Path(path).name for path in stage.outputs)
+            print(f"{stage.name}: {inputs} -> {outputs}")
+        return
+
+    start = time.perf_counter()
+    try:
+        status = run(STAGES, args.stages, force=args.force, jobs=args.jobs)
+    except ValueError as err:
+        parser.error(str(err))
+    for name, result in status.items():
+        print(f"{name:>20}  {result}")
+    print(f"finished in {time.perf_counter() - start:.2f}s")
+
+    if not args.no_validate and any(result in ("ran", "updated") for result in status.values()):
+        from trends import validation
+
+        problems = validation.failed(validation.validate())
+        if len(problems):
+            print(problems.to_string(index=False))
+            sys.exit(1)
+        print("all dataset checks passed")
+
+
+if __name__ == "__main__":
+    main()
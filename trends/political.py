@@ -0,0 +1,181 @@
+"""
+Derive each state's political colour (RED/BLUE/PURPLE) from the presidential
+election results and write it back into the incident dataset.
+
+This replaces the "get political leanings for each state" query in
+`SQL Queries for Gun Violence.sql`. Instead of one `SELECT TOP 1` subquery per
+state and year, the winner of every (state, year) is found with a single
+grouped argmax over `candidatevotes`.
+
+The years, rule and margin are saved in data/political_color.json, which
+`trends.pipeline` reads too, so rebuilding the datasets keeps the colours
+picked here. Options that aren't given keep their saved value.
+
+Run from the root of the repo:
+
+    python -m trends.political
+    python -m trends.political --years 2012 2016 2020 2024
+    python -m trends.political --rule margin --margin 0.05
+"""
+import argparse
+import json
+
+import pandas as pd
+
+from trends import paths
+
+ELECTION_YEARS = (2012, 2016, 2020)
+
+PARTY_COLOR = {"REPUBLICAN": "RED", "DEMOCRAT": "BLUE"}
+
+DEFAULT_CONFIG = {"years": ELECTION_YEARS, "rule": "unanimous", "margin": 0.05}
+
+
+def load_config(path=paths.POLITICAL_CONFIG):
+    # keyword arguments of state_colors the colours were last derived with
+    config = dict(DEFAULT_CONFIG)
+    if path.exists():
+        config.update(json.loads(path.read_text()))
+    config["years"] = tuple(config["years"])
+    return config
+
+
+def save_config(config, path=paths.POLITICAL_CONFIG):
+    config = dict(config, years=list(config["years"]))
+    path.write_text(json.dumps(config, indent=1, sort_keys=True) + "\n")
+
+
+def load_president(path=paths.PRESIDENT):
+    return pd.read_csv(path)
+
+
+def state_name(state):
+    # the election results are in upper case ("DISTRICT OF COLUMBIA"), the
+    # incident data uses title case with a lower case "of"
+    return state.str.title().str.replace(" Of ", " of ", regex=False)
+
+
+def election_votes(president, years=ELECTION_YEARS):
+    votes = president[president["year"].isin(years)]
+    missing = sorted(set(years) - set(votes["year"].unique()))
+    if missing:
+        raise ValueError(f"no election results for year(s) {missing}")
+    return votes
+
+
+def winning_party(president, years=ELECTION_YEARS):
+    # one row per state, one column per election year, holding the party with
+    # the most votes that year
+    votes = election_votes(president, years)
+    winners = votes.loc[votes.groupby(["state", "year"])["candidatevotes"].idxmax()]
+    winners = winners.pivot(index="state", columns="year", values="party_simplified")
+    return winners[list(years)]
+
+
+def party_margin(president, years=ELECTION_YEARS):
+    # republican minus democrat share of all votes cast, averaged over the years.
+    # positive leans red, negative leans blue
+    votes = election_votes(president, years)
+    totals = votes.groupby(["state", "year"])["candidatevotes"].sum()
+    parties = (
+        votes[votes["party_simplified"].isin(PARTY_COLOR)]
+        .groupby(["state", "year", "party_simplified"])["candidatevotes"].sum()
+        .unstack(fill_value=0)
+        .reindex(columns=list(PARTY_COLOR), fill_value=0)
+    )
+    margin = (parties["REPUBLICAN"] - parties["DEMOCRAT"]) / totals
+    return margin.groupby(level="state").mean()
+
+
+# classification rules, each takes the election results and returns a
+# state -> colour Series. new rules only need to be added to RULES
+def unanimous_rule(president, years=ELECTION_YEARS, margin=None):
+    # a state is RED or BLUE only if the same party won every election,
+    # which is how the original SQL query classified them
+    winners = winning_party(president, years)
+    first = winners.iloc[:, 0]
+    same = winners.eq(first, axis=0).all(axis=1)
+    colors = first.map(PARTY_COLOR).where(same, "PURPLE")
+    return colors.fillna("PURPLE")
+
+
+def margin_rule(president, years=ELECTION_YEARS, margin=0.05):
+    # a state is PURPLE if its average margin is within +/- margin
+    avg_margin = party_margin(president, years)
+    colors = pd.Series("PURPLE", index=avg_margin.index)
+    colors[avg_margin > margin] = "RED"
+    colors[avg_margin < -margin] = "BLUE"
+    return colors
+
+
+RULES = {
+    "unanimous": unanimous_rule,
+    "margin": margin_rule,
+}
+
+
+def state_colors(president, years=ELECTION_YEARS, rule="unanimous", margin=0.05):
+    if rule not in RULES:
+        raise ValueError(f"unknown rule {rule!r}, expected one of {sorted(RULES)}")
+    colors = RULES[rule](president, years=years, margin=margin)
+    colors.index = state_name(colors.index.to_series())
+    colors = colors.sort_index()
+    return pd.DataFrame({"STATE_NAME": colors.index, "COLOR": colors.values})
+
+
+def apply_colors(incidents, colors):
+    # overwrite State_Political_Color in place of the old merge in SQL Server
+    incidents = incidents.copy()
+    incidents["State_Political_Color"] = incidents["State_Name"].map(
+        colors.set_index("STATE_NAME")["COLOR"]
+    )
+    return incidents
+
+
+def regenerate(years=ELECTION_YEARS, rule="unanimous", margin=0.05,
+               president_path=paths.PRESIDENT,
+               colors_path=paths.STATE_PARTY_COLOR,
+               merged_path=paths.MERGED_INCIDENTS,
+               config_path=paths.POLITICAL_CONFIG):
+    # recompute the colours and rewrite both state_party_color.csv and the
+    # merged incident dataset, and save the settings for the pipeline
+    colors = state_colors(load_president(president_path), years, rule, margin)
+    merged = apply_colors(pd.read_csv(merged_path), colors)
+
+    unmatched = merged.loc[merged["State_Political_Color"].isna(), "State_Name"].unique()
+    if len(unmatched):
+        raise ValueError(f"no political colour for state(s) {sorted(unmatched)}")
+
+    colors.to_csv(colors_path, index=False)
+    merged.to_csv(merged_path, index=False)
+    save_config({"years": years, "rule": rule, "margin": margin}, config_path)
+    return colors, merged
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--years", type=int, nargs="+",
+                        help="election years to take into account")
+    parser.add_argument("--rule", choices=sorted(RULES),
+                        help="how to turn election results into a colour")
+    parser.add_argument("--margin", type=float,
+                        help="average vote margin below which a state is PURPLE (margin rule)")
+    parser.add_argument("--president", default=paths.PRESIDENT,
+                        help="election results csv with year, state, candidatevotes, party_simplified")
+    args = parser.parse_args(argv)
+
+    config = load_config()
+    for key in ("years", "rule", "margin"):
+        if getattr(args, key) is not None:
+            config[key] = getattr(args, key)
+
+    try:
+        colors, _ = regenerate(tuple(config["years"]), config["rule"], config["margin"],
+                               president_path=args.president)
+    except ValueError as err:
+        parser.error(str(err))
+    print(colors["COLOR"].value_counts().to_string())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Column profiles of the datasets in data/, for the Details page.
+
+A profile holds, per column, the dtype, non-null and null counts, number of
+distinct values, summary statistics for numeric columns and the most common
+values. It's computed once per version of a file and saved as JSON in
+data/.cache/profiles, keyed by the file's content hash, so the page renders
+from the saved profile instead of recomputing `info()`, `isna()`,
+`describe()` and `value_counts()` on every rerun.
+
+Profile every dataset ahead of time with:
+
+    python -m trends.profile
+"""
+import json
+import os
+import tempfile
+
+import pandas as pd
+
+from trends import paths, store
+
+PROFILE_DIR = paths.CACHE_DIR / "profiles"
+TOP_K = 20
+
+
+def build(frame, top_k=TOP_K):
+    nulls = frame.isna().sum()
+    columns = pd.DataFrame({
+        "Column": frame.columns,
+        "Dtype": [str(dtype) for dtype in frame.dtypes],
+        "Non-Null Count": (len(frame) - nulls).to_numpy(),
+        "Null Count": nulls.to_numpy(),
+        "Unique": frame.nunique().to_numpy(),
+    })
+
+    numeric = frame.select_dtypes("number")
+    describe = numeric.describe() if len(numeric.columns) else pd.DataFrame()
+
+    top_values = {}
+    for column in frame.columns:
+        counts = frame[column].value_counts().head(top_k)
+        top_values[column] = [[value, int(count)] for value, count in counts.items()]
+
+    return {
+        "rows": len(frame),
+        "columns": columns.to_dict("list"),
+        "describe": describe.to_dict("split"),
+        "top_values": top_values,
+    }
+
+
+def columns(profile):
+    return pd.DataFrame(profile["columns"])
+
+
+def describe(profile, cols=None):
+    # same layout as DataFrame.describe()
+    split = profile["describe"]
+    table = pd.DataFrame(split["data"], index=split["index"], columns=split["columns"])
+    return table if cols is None else table[cols]
+
+
+def value_counts(profile, column, n=None):
+    # same layout as Series.value_counts(), limited to the TOP_K most common
+    pairs = profile["top_values"][column][:n]
+    values = [value for value, _ in pairs]
+    counts = [count for _, count in pairs]
+    return pd.Series(counts, index=pd.Index(values, name=column), name="count")
+
+
+def null_counts(profile):
+    table = columns(profile).set_index("Column")
+    return table["Null Count"].rename_axis(None)
+
+
+def profile_path(path):
+    return PROFILE_DIR / f"{path.stem}-{store.version(path)}.json"
+
+
+def load(path, read_options=None):
+    # the profile of the csv at path, computed the first time this version of
+    # the file is seen
+    target = profile_path(path)
+    if target.exists():
+        return json.loads(target.read_text())
+
+    profile = build(store.attach(path, read_options))
+    PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=PROFILE_DIR, suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        json.dump(profile, f, default=lambda value: value.item())
+    os.chmod(tmp, 0o644)
+    os.replace(tmp, target)
+    return profile
+
+
+def main():
+    from trends.validation import DATASETS
+
+    for name, path in DATASETS.items():
+        if path.exists():
+            profile = load(path)
+            print(f"{name}: {profile['rows']} rows, {len(profile['columns']['Column'])} columns")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,27 @@
+"""
+The census regions each state belongs to, for the US_Region column.
+
+Kept apart from trends.stages so the pages and checks that only need the
+mapping don't import the pipeline.
+"""
+REGIONS = {
+    "Northeast": (
+        "Connecticut", "Maine", "Massachusetts", "New Hampshire", "New Jersey",
+        "New York", "Pennsylvania", "Rhode Island", "Vermont",
+    ),
+    "Midwest": (
+        "Illinois", "Indiana", "Iowa", "Kansas", "Michigan", "Minnesota",
+        "Missouri", "Nebraska", "North Dakota", "Ohio", "South Dakota", "Wisconsin",
+    ),
+    "South": (
+        "Alabama", "Arkansas", "Delaware", "District of Columbia", "Florida",
+        "Georgia", "Kentucky", "Louisiana", "Maryland", "Mississippi",
+        "North Carolina", "Oklahoma", "South Carolina", "Tennessee", "Texas",
+        "Virginia", "West Virginia",
+    ),
+    "West": (
+        "Alaska", "Arizona", "California", "Colorado", "Hawaii", "Idaho",
+        "Montana", "Nevada", "New Mexico", "Oregon", "Utah", "Washington", "Wyoming",
+    ),
+}
+STATE_REGION = {state: region for region, states in REGIONS.items() for state in states}
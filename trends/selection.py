@@ -0,0 +1,70 @@
+"""
+Row-index sets for filtering and linked brushing in the Visualize page.
+
+The sidebar filters and the selections made on the charts are all kept as
+sorted arrays of row positions into the shared incident dataset. Combining
+them is a set intersection on integers, and the page only takes the rows it
+needs out of the dataset once per chart instead of merging DataFrames.
+"""
+import numpy as np
+
+# column of the map's custom data holding the row position of each incident
+ROW_COLUMN = "Row"
+
+
+def filter_rows(data, year, state_ids):
+    # row positions matching the sidebar filters. the regions and states
+    # picked there come in as the ids of the selected states
+    mask = (
+        data["state_id"].isin(state_ids).to_numpy()
+        & (data["Year"] >= year[0]).to_numpy()
+        & (data["Year"] <= year[1]).to_numpy()
+    )
+    return np.flatnonzero(mask)
+
+
+def rows_with_values(data, column, values):
+    # row positions where column holds one of values (ids of the clicked
+    # bars' labels on the fact table)
+    return np.flatnonzero(data[column].isin(values).to_numpy())
+
+
+def rows_with_ids(data, ids):
+    # row positions of the incidents in ids, None passes through as "no selection"
+    if ids is None:
+        return None
+    return np.flatnonzero(data["Incident_ID"].isin(ids).to_numpy())
+
+
+def intersect(*row_sets):
+    # intersection of sorted row position arrays, None means "no selection"
+    rows = None
+    for row_set in row_sets:
+        if row_set is None:
+            continue
+        rows = row_set if rows is None else np.intersect1d(rows, row_set, assume_unique=True)
+    return rows
+
+
+def selected_points(state):
+    # the points of a st.plotly_chart selection, state is the value kept in
+    # st.session_state under the chart's key
+    if not state:
+        return []
+    return state.get("selection", {}).get("points", [])
+
+
+def selected_rows(state):
+    # row positions picked by a box or lasso selection on the map, None if
+    # nothing is selected
+    points = selected_points(state)
+    rows = [point["customdata"][0] for point in points if point.get("customdata")]
+    if not rows:
+        return None
+    return np.unique(np.asarray(rows, dtype=np.int64))
+
+
+def selected_values(state, axis="x"):
+    # category labels clicked on a bar chart, None if nothing is selected
+    values = {point[axis] for point in selected_points(state) if axis in point}
+    return values or None
@@ -0,0 +1,123 @@
+"""
+The steps that turn the raw downloads in data/ into the curated datasets the
+pages read. These used to live in `us_population.ipynb` and
+`SQL Queries for Gun Violence.sql`; `trends.pipeline` runs them.
+
+Fixing the city names (city_not_fixed -> cleaned) was done by hand against the
+census place names, so `cleaned_mass_shootings_2014-2023.csv` is treated as a
+source rather than rebuilt.
+"""
+from trends import census, paths, political
+from trends.pipeline import Stage
+from trends.regions import STATE_REGION
+
+STUDY_YEARS = range(2014, 2024)
+
+
+def population_columns(years):
+    return ["POPESTIMATE" + str(year) for year in years]
+
+
+def state_population(est2019, est2023):
+    # keep the name and the estimate for each year we study, then join the
+    # two census vintages on NAME
+    est2019 = est2019[["NAME"] + population_columns(range(2014, 2020))]
+    est2023 = est2023[["NAME"] + population_columns(range(2020, 2024))]
+    return est2019.merge(est2023, on="NAME", how="inner")
+
+
+def city_population(*vintages):
+    # the census files are read in chunks straight into the long table, see
+    # trends/census.py
+    return census.city_population(vintages, first_year=STUDY_YEARS[0])
+
+
+def election_results(president):
+    # state-level presidential results from 2012 onwards
+    president = president[president["year"] >= 2012]
+    return president[["year", "state", "candidatevotes", "party_simplified"]]
+
+
+def party_color(president, config):
+    # with the years, rule and margin last picked with trends.political
+    return political.state_colors(political.load_president(president), **political.load_config(config))
+
+
+def incidents(raw):
+    # only keep incidents that fit the Gun Violence Archive definition of a
+    # mass shooting, drop the suspect and free text columns and add the
+    # engineered features
+    raw = raw[(raw["Victims_Injured"] + raw["Victims_Killed"]) >= 4]
+    keep = [
+        "Incident_ID", "Incident_Date", "Incident_Time", "State_Name", "City_or_County",
+        "Latitude", "Longitude", "Victims_Killed", "Victims_Injured", "Year", "Month", "Day",
+    ]
+    cleaned = raw[keep].copy()
+    cleaned["Total_Victims"] = cleaned["Victims_Injured"] + cleaned["Victims_Killed"]
+    cleaned["US_Region"] = cleaned["State_Name"].map(STATE_REGION)
+    return cleaned[sorted(cleaned.columns)].reset_index(drop=True)
+
+
+def long_population(wide, keys):
+    # one row per place and year instead of one POPESTIMATE column per year
+    long = wide.melt(id_vars=keys, value_vars=population_columns(STUDY_YEARS),
+                     var_name="Year", value_name="PopEstimate")
+    long["Year"] = long["Year"].str[-4:].astype(int)
+    return long
+
+
+def merged(cleaned, colors, state_pop, city_pop):
+    # add the political color of the state and the population of the state
+    # and city in the year of the incident
+    state_pop = long_population(state_pop, ["NAME"]).rename(
+        columns={"NAME": "State_Name", "PopEstimate": "State_PopEstimate"})
+
+    merged = political.apply_colors(cleaned, colors)
+    merged = merged.merge(state_pop, on=["State_Name", "Year"], how="left")
+    merged = merged.merge(city_pop, on=["City_or_County", "State_Name", "Year"], how="left")
+    return merged
+
+
+def recolor(colors, merged):
+    # without the census inputs the merged incidents can't be rebuilt, but
+    # their colours still follow state_party_color.csv
+    return political.apply_colors(merged, colors)
+
+
+STAGES = [
+    Stage(
+        "state_population", state_population,
+        inputs=(paths.RAW_STATE_POPULATION_2019, paths.RAW_STATE_POPULATION_2023),
+        outputs=(paths.STATE_POPULATION,),
+    ),
+    Stage(
+        "city_population", city_population,
+        inputs=tuple(paths.RAW_CITY_POPULATION),
+        outputs=(paths.CITY_POPULATION,),
+        stream=True,
+    ),
+    Stage(
+        "election_results", election_results,
+        inputs=(paths.RAW_PRESIDENT,),
+        outputs=(paths.PRESIDENT,),
+    ),
+    Stage(
+        "party_color", party_color,
+        inputs=(paths.PRESIDENT, paths.POLITICAL_CONFIG),
+        outputs=(paths.STATE_PARTY_COLOR,),
+        stream=True,
+    ),
+    Stage(
+        "incidents", incidents,
+        inputs=(paths.RAW_INCIDENTS,),
+        outputs=(paths.CITY_NOT_FIXED_INCIDENTS,),
+    ),
+    Stage(
+        "merged", merged,
+        inputs=(paths.CLEANED_INCIDENTS, paths.STATE_PARTY_COLOR,
+                paths.STATE_POPULATION, paths.CITY_POPULATION),
+        outputs=(paths.MERGED_INCIDENTS,),
+        partial=recolor,
+        partial_inputs=(paths.STATE_PARTY_COLOR,),
+    ),
+]
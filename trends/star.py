@@ -0,0 +1,246 @@
+"""
+The merged incident dataset as a star schema.
+
+`merged_mass_shootings_2014-2023.csv` repeats the state, region, political
+color, city and both population estimates as text on every incident. Here the
+incidents become a fact table of small integers (int16 state_id, int32
+place_id, int16 victims...) and the text lives once in dimension tables:
+
+- state: state_id, State_Name, region_id, color_id
+- region: region_id, US_Region
+- color: color_id, State_Political_Color
+- place: place_id, state_id, City_or_County
+- state_population: (state_id, Year) -> State_PopEstimate
+- place_population: (place_id, Year) -> City_PopEstimate
+
+Group-bys run on the integer keys, and `resolve` joins the labels back only for
+the rows that are about to be shown. The fact table keeps the row order of the
+merged CSV, so row positions are the same in both. The Visualize page works on
+the fact table: its filters, bar charts, rates and exports group and select on
+state_id and place_id and only resolve the rows they draw or export.
+
+Build (or refresh) the tables with:
+
+    python -m trends.star
+"""
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from trends import paths, store
+
+STAR_DIR = paths.CACHE_DIR / "star"
+TABLES = ("fact", "state", "region", "color", "place", "state_population", "place_population")
+
+
+@dataclass
+class Star:
+    fact: pd.DataFrame
+    state: pd.DataFrame
+    region: pd.DataFrame
+    color: pd.DataFrame
+    place: pd.DataFrame
+    state_population: pd.DataFrame
+    place_population: pd.DataFrame
+
+    def tables(self):
+        return {name: getattr(self, name) for name in TABLES}
+
+    def memory_usage(self):
+        # bytes held by every table, strings included
+        return sum(int(table.memory_usage(deep=True).sum()) for table in self.tables().values())
+
+
+def codes(values, dtype):
+    # integer code of each value and the sorted labels they point to
+    labels, uniques = pd.factorize(values, sort=True)
+    return labels.astype(dtype), uniques
+
+
+def time_to_minutes(times):
+    # "12:30 AM" -> 30, missing times become -1
+    parsed = pd.to_datetime(times, format="%I:%M %p")
+    minutes = parsed.dt.hour * 60 + parsed.dt.minute
+    return minutes.fillna(-1).astype(np.int16)
+
+
+def minutes_to_time(minutes):
+    # inverse of time_to_minutes, "1:05 PM" without a leading zero like the source
+    minutes = pd.Series(minutes)
+    hours, mins = minutes // 60, minutes % 60
+    hour12 = (hours % 12).replace(0, 12)
+    text = hour12.astype(str) + ":" + mins.astype(str).str.zfill(2) + np.where(hours < 12, " AM", " PM")
+    return text.where(minutes >= 0)
+
+
+def build(merged):
+    region_id, regions = codes(merged["US_Region"], np.int8)
+    color_id, colors = codes(merged["State_Political_Color"], np.int8)
+    state_id, states = codes(merged["State_Name"], np.int16)
+
+    state = pd.DataFrame({"state_id": np.arange(len(states), dtype=np.int16), "State_Name": states})
+    state_keys = pd.DataFrame({"state_id": state_id, "region_id": region_id, "color_id": color_id})
+    state = state.merge(state_keys.drop_duplicates("state_id"), on="state_id")
+
+    # a place is a city name within a state
+    place_keys = pd.DataFrame({"state_id": state_id, "City_or_County": merged["City_or_County"].to_numpy()})
+    place_id, places = pd.factorize(pd.MultiIndex.from_frame(place_keys), sort=True)
+    place = places.to_frame(index=False, name=["state_id", "City_or_County"])
+    place["state_id"] = place["state_id"].astype(np.int16)
+    place.insert(0, "place_id", np.arange(len(place), dtype=np.int32))
+
+    year = merged["Year"].to_numpy().astype(np.int16)
+    fact = pd.DataFrame({
+        "Incident_ID": merged["Incident_ID"].to_numpy(),
+        "Year": year,
+        "Month": merged["Month"].to_numpy().astype(np.int8),
+        "Day": merged["Day"].to_numpy().astype(np.int8),
+        "Minutes": time_to_minutes(merged["Incident_Time"]).to_numpy(),
+        "state_id": state_id,
+        "place_id": place_id.astype(np.int32),
+        "Latitude": merged["Latitude"].to_numpy(),
+        "Longitude": merged["Longitude"].to_numpy(),
+        "Victims_Injured": merged["Victims_Injured"].to_numpy().astype(np.int16),
+        "Victims_Killed": merged["Victims_Killed"].to_numpy().astype(np.int16),
+        "Total_Victims": merged["Total_Victims"].to_numpy().astype(np.int16),
+    })
+
+    state_population = (
+        pd.DataFrame({"state_id": state_id, "Year": year,
+                      "State_PopEstimate": merged["State_PopEstimate"].to_numpy()})
+        .drop_duplicates(["state_id", "Year"])
+        .sort_values(["state_id", "Year"], ignore_index=True)
+    )
+    place_population = (
+        pd.DataFrame({"place_id": fact["place_id"], "Year": year,
+                      "City_PopEstimate": merged["City_PopEstimate"].to_numpy()})
+        .drop_duplicates(["place_id", "Year"])
+        .sort_values(["place_id", "Year"], ignore_index=True)
+    )
+
+    return Star(
+        fact=fact,
+        state=state,
+        region=pd.DataFrame({"region_id": np.arange(len(regions), dtype=np.int8), "US_Region": regions}),
+        color=pd.DataFrame({"color_id": np.arange(len(colors), dtype=np.int8),
+                            "State_Political_Color": colors}),
+        place=place,
+        state_population=state_population,
+        place_population=place_population,
+    )
+
+
+def lookup(keys, table, key, column):
+    # values of table[column] for each key, a positional take on the key column
+    positions = pd.Index(table[key]).get_indexer(keys)
+    return table[column].to_numpy()[positions]
+
+
+def resolve(star, fact=None, columns=None):
+    # fact rows with the label columns of the merged dataset joined back on.
+    # pass only the rows that will be shown
+    fact = star.fact if fact is None else fact
+    state_id = fact["state_id"].to_numpy()
+    region_id = lookup(state_id, star.state, "state_id", "region_id")
+    color_id = lookup(state_id, star.state, "state_id", "color_id")
+
+    labels = {
+        "State_Name": lambda: lookup(state_id, star.state, "state_id", "State_Name"),
+        "US_Region": lambda: lookup(region_id, star.region, "region_id", "US_Region"),
+        "State_Political_Color": lambda: lookup(color_id, star.color, "color_id", "State_Political_Color"),
+        "City_or_County": lambda: lookup(fact["place_id"], star.place, "place_id", "City_or_County"),
+        "Incident_Date": lambda: pd.to_datetime(pd.DataFrame({
+            "year": fact["Year"], "month": fact["Month"], "day": fact["Day"]})).dt.strftime("%Y-%m-%d").to_numpy(),
+        "Incident_Time": lambda: minutes_to_time(fact["Minutes"].to_numpy()).to_numpy(),
+        "State_PopEstimate": lambda: population(star.state_population, "state_id", "State_PopEstimate",
+                                                state_id, fact["Year"]),
+        "City_PopEstimate": lambda: population(star.place_population, "place_id", "City_PopEstimate",
+                                               fact["place_id"], fact["Year"]),
+    }
+    columns = list(labels) if columns is None else columns
+    resolved = fact.copy()
+    for column in columns:
+        resolved[column] = labels[column]()
+    return resolved
+
+
+def states(star):
+    # State_Name, US_Region and State_Political_Color indexed by state_id, in
+    # the order the states first appear in the incidents (like unique() on
+    # the merged rows, which the page's filter options were built from)
+    first = pd.unique(star.fact["state_id"])
+    table = resolve(star, pd.DataFrame({"state_id": first}), ["State_Name", "US_Region", "State_Political_Color"])
+    return table.set_index("state_id")[["State_Name", "US_Region", "State_Political_Color"]]
+
+
+# label column -> dimension table and key it hangs off
+LABEL_KEYS = {"State_Name": ("state", "state_id"), "City_or_County": ("place", "place_id")}
+
+
+def label_codes(star, column):
+    # (key column, code of each key's label, sorted labels), so grouping on a
+    # label is grouping on integers. places with the same name in different
+    # states share a code, the same as grouping by the name
+    table, key = LABEL_KEYS[column]
+    table = getattr(star, table)
+    codes, labels = pd.factorize(table[column], sort=True)
+    by_key = np.empty(int(table[key].max()) + 1, dtype=np.int32)
+    by_key[table[key].to_numpy()] = codes
+    return key, by_key, np.asarray(labels, dtype=object)
+
+
+def population(table, key, column, keys, years):
+    index = pd.MultiIndex.from_frame(table[[key, "Year"]])
+    positions = index.get_indexer(pd.MultiIndex.from_arrays([np.asarray(keys), np.asarray(years)]))
+    return table[column].to_numpy()[positions]
+
+
+def to_merged(star, fact=None):
+    # the rows in the column layout of merged_mass_shootings_2014-2023.csv
+    merged_columns = [
+        "City_or_County", "Day", "Incident_Date", "Incident_ID", "Incident_Time", "Latitude",
+        "Longitude", "Month", "State_Name", "Total_Victims", "US_Region", "Victims_Injured",
+        "Victims_Killed", "Year", "State_Political_Color", "State_PopEstimate", "City_PopEstimate",
+    ]
+    resolved = resolve(star, fact)
+    resolved = resolved.astype({column: "int64" for column in (
+        "Day", "Month", "Year", "Total_Victims", "Victims_Injured", "Victims_Killed")})
+    return resolved[merged_columns]
+
+
+def save(star, directory):
+    for name, table in star.tables().items():
+        store.write_columnar(table, directory / f"{name}.feather")
+
+
+def load(directory):
+    tables = {}
+    for name in TABLES:
+        source = pa.memory_map(str(directory / f"{name}.feather"))
+        tables[name] = pa.ipc.open_file(source).read_all().to_pandas(split_blocks=True, self_destruct=False)
+    return Star(**tables)
+
+
+def attach(path=paths.MERGED_INCIDENTS):
+    # the star schema of the merged dataset, built once per dataset version
+    directory = STAR_DIR / store.version(path)
+    if not all((directory / f"{name}.feather").exists() for name in TABLES):
+        save(build(store.attach(path)), directory)
+    return load(directory)
+
+
+def main():
+    star = attach()
+    merged = store.attach(paths.MERGED_INCIDENTS)
+    before = int(merged.memory_usage(deep=True).sum())
+    after = star.memory_usage()
+    print(f"merged  {before / 1e6:8.2f} MB")
+    print(f"star    {after / 1e6:8.2f} MB  ({before / after:.1f}x smaller)")
+    for name, table in star.tables().items():
+        print(f"  {name:<18}{len(table):>8} rows  {table.memory_usage(deep=True).sum() / 1e6:8.3f} MB")
+
+
+if __name__ == "__main__":
+    main()
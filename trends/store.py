@@ -0,0 +1,76 @@
+"""
+A read-only dataset store shared by every Streamlit process on the machine.
+
+`st.cache_data` keeps a copy of each dataset per server process and hands a
+fresh copy to every session. Instead, each CSV is published once as an
+uncompressed Arrow IPC file in data/.cache (the same columnar copies
+`trends.pipeline` writes), and the pages attach to it with a memory map. The
+numeric columns come back as read-only views over the mapped file, so several
+server processes behind a load balancer share the same physical pages and
+start without parsing any CSV.
+
+Publish everything the pages read before starting the servers:
+
+    python -m trends.store
+"""
+import os
+import tempfile
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+from trends import paths
+from trends.pipeline import columnar_path, file_hash
+
+# the datasets the pages load
+PAGE_DATASETS = (
+    paths.RAW_INCIDENTS,
+    paths.CLEANED_INCIDENTS,
+    paths.MERGED_INCIDENTS,
+)
+
+
+def write_columnar(frame, target):
+    # uncompressed so the file can be memory mapped without decoding. written
+    # to a temporary file first so a replica never maps a half written file
+    target.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=target.parent, suffix=".tmp")
+    os.close(fd)
+    try:
+        feather.write_feather(frame.reset_index(drop=True), tmp, compression="uncompressed")
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, target)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def version(path):
+    # content hash of a dataset, used to key anything derived from it
+    return file_hash(path)[:16]
+
+
+def publish(path, read_options=None):
+    # make sure the columnar copy of the csv at path exists, returns its path
+    target = columnar_path(path, file_hash(path))
+    if not target.exists():
+        write_columnar(pd.read_csv(path, **(read_options or {})), target)
+    return target
+
+
+def attach(path, read_options=None):
+    # DataFrame backed by the memory mapped columnar copy of the csv at path.
+    # treat it as read-only, filtering or merging it gives ordinary copies
+    source = pa.memory_map(str(publish(path, read_options)))
+    table = pa.ipc.open_file(source).read_all()
+    return table.to_pandas(split_blocks=True, self_destruct=False)
+
+
+def main():
+    for path in PAGE_DATASETS:
+        print(f"{path.name} -> {publish(path).name}")
+
+
+if __name__ == "__main__":
+    main()
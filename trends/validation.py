@@ -0,0 +1,300 @@
+"""
+Schema and rule checks for the datasets in data/.
+
+Each rule is a vectorized check over whole columns that returns a boolean
+array marking the rows that break it, so running every rule over every
+dataset is a handful of column operations even for files with millions of
+rows. Rules that need another dataset (the population table, the colors) get
+all loaded datasets passed in.
+
+Run from the root of the repo:
+
+    python -m trends.validation
+
+It prints a summary and exits with status 1 if any error-level rule fails.
+"""
+import sys
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from trends import paths
+from trends.regions import STATE_REGION
+
+DATASETS = {
+    "raw_incidents": paths.RAW_INCIDENTS,
+    "city_not_fixed_incidents": paths.CITY_NOT_FIXED_INCIDENTS,
+    "cleaned_incidents": paths.CLEANED_INCIDENTS,
+    "merged_incidents": paths.MERGED_INCIDENTS,
+    "state_population": paths.STATE_POPULATION,
+    "president": paths.PRESIDENT,
+    "party_color": paths.STATE_PARTY_COLOR,
+}
+INCIDENTS = ("raw_incidents", "city_not_fixed_incidents", "cleaned_incidents", "merged_incidents")
+ENGINEERED = ("city_not_fixed_incidents", "cleaned_incidents", "merged_incidents")
+
+STUDY_YEARS = range(2014, 2024)
+COLORS = ("RED", "BLUE", "PURPLE")
+PARTIES = ("DEMOCRAT", "REPUBLICAN", "LIBERTARIAN", "OTHER")
+
+# bounding box around the states, Alaska and Hawaii included
+LATITUDE = (18.0, 72.0)
+LONGITUDE = (-180.0, -65.0)
+
+INCIDENT_SCHEMA = {
+    "Incident_ID": "int",
+    "Incident_Date": "str",
+    "State_Name": "str",
+    "City_or_County": "str",
+    "Latitude": "float",
+    "Longitude": "float",
+    "Victims_Killed": "int",
+    "Victims_Injured": "int",
+    "Year": "int",
+    "Month": "int",
+    "Day": "int",
+}
+SCHEMAS = {
+    "raw_incidents": INCIDENT_SCHEMA,
+    "city_not_fixed_incidents": {**INCIDENT_SCHEMA, "Total_Victims": "int", "US_Region": "str"},
+    "cleaned_incidents": {**INCIDENT_SCHEMA, "Total_Victims": "int", "US_Region": "str"},
+    "merged_incidents": {
+        **INCIDENT_SCHEMA, "Total_Victims": "int", "US_Region": "str",
+        "State_Political_Color": "str", "State_PopEstimate": "int", "City_PopEstimate": "int",
+    },
+    "state_population": {
+        "NAME": "str", **{"POPESTIMATE" + str(year): "int" for year in STUDY_YEARS},
+    },
+    "president": {
+        "year": "int", "state": "str", "candidatevotes": "int", "party_simplified": "str",
+    },
+    "party_color": {"STATE_NAME": "str", "COLOR": "str"},
+}
+
+KIND_CHECKS = {
+    "int": pd.api.types.is_integer_dtype,
+    "float": pd.api.types.is_numeric_dtype,
+    "str": lambda dtype: pd.api.types.is_object_dtype(dtype) or pd.api.types.is_string_dtype(dtype),
+}
+
+
+@dataclass(frozen=True)
+class Rule:
+    name: str
+    datasets: tuple
+    # (frame, all loaded frames) -> boolean array, True where a row breaks the rule
+    check: object
+    description: str
+    # datasets where a failure is expected and only reported as a warning
+    warn_only: tuple = ()
+
+
+def population_states(frames):
+    # state rows of the population table, without the national and region totals
+    names = frames["state_population"]["NAME"]
+    return set(names[~names.str.endswith("Region") & (names != "United States")])
+
+
+def unique_id(frame, frames):
+    return frame["Incident_ID"].duplicated(keep=False).to_numpy()
+
+
+def mass_shooting_definition(frame, frames):
+    # the Gun Violence Archive counts a mass shooting from four victims shot
+    return ((frame["Victims_Injured"] + frame["Victims_Killed"]) < 4).to_numpy()
+
+
+def total_victims(frame, frames):
+    return (frame["Total_Victims"] != frame["Victims_Injured"] + frame["Victims_Killed"]).to_numpy()
+
+
+def within_us(frame, frames):
+    return ~(
+        frame["Latitude"].between(*LATITUDE) & frame["Longitude"].between(*LONGITUDE)
+    ).to_numpy()
+
+
+def known_state(frame, frames):
+    return ~frame["State_Name"].isin(population_states(frames)).to_numpy()
+
+
+def known_region(frame, frames):
+    return (frame["State_Name"].map(STATE_REGION) != frame["US_Region"]).to_numpy()
+
+
+def population_present(frame, frames):
+    # the state has a population estimate for the year of the incident, and
+    # the merged estimates are there
+    population = frames["state_population"].melt(
+        id_vars="NAME", value_vars=["POPESTIMATE" + str(year) for year in STUDY_YEARS],
+        var_name="Year", value_name="Population")
+    population["Year"] = population["Year"].str[-4:].astype(int)
+    index = pd.MultiIndex.from_frame(population[["NAME", "Year"]])
+    positions = index.get_indexer(pd.MultiIndex.from_arrays([frame["State_Name"], frame["Year"]]))
+    estimates = population["Population"].to_numpy()[positions]
+    present = (positions >= 0) & (estimates > 0)
+    merged = (frame["State_PopEstimate"] > 0) & (frame["City_PopEstimate"] > 0)
+    return ~(present & merged.to_numpy())
+
+
+def color_matches(frame, frames):
+    colors = frames["party_color"].set_index("STATE_NAME")["COLOR"]
+    return (frame["State_Name"].map(colors) != frame["State_Political_Color"]).to_numpy()
+
+
+def positive_population(frame, frames):
+    estimates = frame[["POPESTIMATE" + str(year) for year in STUDY_YEARS]]
+    return ~(estimates.notna() & (estimates > 0)).all(axis=1).to_numpy()
+
+
+def negative_votes(frame, frames):
+    return (frame["candidatevotes"] < 0).to_numpy()
+
+
+def unique_name(column):
+    def check(frame, frames):
+        return frame[column].duplicated(keep=False).to_numpy()
+    return check
+
+
+def known_values(column, values):
+    def check(frame, frames):
+        return ~frame[column].isin(values).to_numpy()
+    return check
+
+
+def every_election(frame, frames):
+    # every state has results for every election year in the file
+    years = frame.groupby("state")["year"].transform("nunique")
+    return (years != frame["year"].nunique()).to_numpy()
+
+
+def colored_state(frame, frames):
+    # every colored state is a state of the population table
+    return ~frame["STATE_NAME"].isin(population_states(frames)).to_numpy()
+
+
+RULES = [
+    Rule("unique_incident_id", INCIDENTS, unique_id,
+         "Incident_ID is unique"),
+    Rule("mass_shooting_definition", INCIDENTS, mass_shooting_definition,
+         "at least 4 victims injured or killed", warn_only=("raw_incidents",)),
+    Rule("total_victims", ENGINEERED, total_victims,
+         "Total_Victims == Victims_Injured + Victims_Killed"),
+    Rule("within_us", INCIDENTS, within_us,
+         "Latitude and Longitude within the US"),
+    Rule("known_state", INCIDENTS, known_state,
+         "State_Name is in the population table"),
+    Rule("known_region", ENGINEERED, known_region,
+         "US_Region is the census region of State_Name"),
+    Rule("population_present", ("merged_incidents",), population_present,
+         "state and city population present for the (state, year)"),
+    Rule("color_matches", ("merged_incidents",), color_matches,
+         "State_Political_Color matches state_party_color.csv"),
+    Rule("unique_state", ("state_population",), unique_name("NAME"),
+         "one row per state"),
+    Rule("positive_population", ("state_population",), positive_population,
+         "a positive estimate for every year"),
+    Rule("known_party", ("president",), known_values("party_simplified", PARTIES),
+         "party_simplified is a known party"),
+    Rule("non_negative_votes", ("president",), negative_votes,
+         "candidatevotes is not negative"),
+    Rule("every_election", ("president",), every_election,
+         "results for every election year"),
+    Rule("unique_color_state", ("party_color",), unique_name("STATE_NAME"),
+         "one row per state"),
+    Rule("known_color", ("party_color",), known_values("COLOR", COLORS),
+         "COLOR is RED, BLUE or PURPLE"),
+    Rule("colored_state", ("party_color",), colored_state,
+         "STATE_NAME is in the population table"),
+]
+RULES_BY_NAME = {rule.name: rule for rule in RULES}
+
+
+def load(names=None):
+    from trends.pipeline import read_table
+
+    names = names or list(DATASETS)
+    return {name: read_table(DATASETS[name]) for name in names if DATASETS[name].exists()}
+
+
+def check_schema(name, frame):
+    # one message per missing column or column of the wrong kind
+    problems = []
+    for column, kind in SCHEMAS.get(name, {}).items():
+        if column not in frame.columns:
+            problems.append(f"missing column {column}")
+        elif not KIND_CHECKS[kind](frame[column].dtype):
+            problems.append(f"{column} is {frame[column].dtype}, expected {kind}")
+    return problems
+
+
+def violations(rule_name, frame, frames=None):
+    # boolean mask of the rows of frame that break the rule
+    return RULES_BY_NAME[rule_name].check(frame, frames or {})
+
+
+def validate(frames=None, rules=RULES, examples=5):
+    # summary with one row per (dataset, rule), plus one per schema problem
+    frames = load() if frames is None else frames
+    report = []
+    for name, frame in frames.items():
+        problems = check_schema(name, frame)
+        for problem in problems:
+            report.append({
+                "Dataset": name, "Rule": "schema", "Description": problem,
+                "Severity": "error", "Rows": len(frame), "Failures": None, "Examples": "",
+            })
+        if problems:
+            # the rules assume the schema holds
+            continue
+
+        for rule in rules:
+            if name not in rule.datasets:
+                continue
+            try:
+                failed = np.asarray(rule.check(frame, frames), dtype=bool)
+            except KeyError as err:
+                # a dataset the rule needs isn't loaded
+                report.append({
+                    "Dataset": name, "Rule": rule.name, "Description": f"skipped, needs {err}",
+                    "Severity": "warning", "Rows": len(frame), "Failures": None, "Examples": "",
+                })
+                continue
+            ids = frame["Incident_ID"] if "Incident_ID" in frame.columns else frame.index.to_series()
+            report.append({
+                "Dataset": name,
+                "Rule": rule.name,
+                "Description": rule.description,
+                "Severity": "warning" if name in rule.warn_only else "error",
+                "Rows": len(frame),
+                "Failures": int(failed.sum()),
+                "Examples": ", ".join(str(i) for i in ids[failed][:examples]),
+            })
+    report = pd.DataFrame(report, columns=[
+        "Dataset", "Rule", "Description", "Severity", "Rows", "Failures", "Examples",
+    ])
+    report["Failures"] = report["Failures"].astype("Int64")
+    return report
+
+
+def failed(report):
+    # error-level rows of a report that didn't pass
+    errors = report[report["Severity"] == "error"]
+    return errors[errors["Failures"].isna() | (errors["Failures"] > 0)]
+
+
+def main():
+    report = validate()
+    with pd.option_context("display.max_colwidth", 60, "display.width", 200):
+        print(report.to_string(index=False))
+    problems = failed(report)
+    if len(problems):
+        print(f"\n{len(problems)} check(s) failed")
+        sys.exit(1)
+    print("\nall checks passed")
+
+
+if __name__ == "__main__":
+    main()